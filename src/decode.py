@@ -1,26 +1,360 @@
 #!/usr/bin/env python3
+import argparse
+import binascii
+import csv
+import enum
+import functools
+import io
+import json
+import os
 import re
 import sys
-import binascii
+import time
 
-from elcobus.ElcobusMessage.ElcobusFrame import ElcobusFrame
+import attr
+
+from elcobus.ElcobusMessage.ElcobusFrame import ElcobusFrame, ElcobusMessage, Field
 
 __import__('elcobus.ElcobusMessage', globals(), level=0, fromlist=['*'])
 # ^^^ equivalent of `from elcobus.ElcobusMessage import *`, but without polluting the namespace
 
 
-for line in sys.stdin:
-    match = re.match('^(.*)EBM: \[([0-9A-Fa-f]{2}(?: [0-9A-Fa-f]{2})*)\](.*)$', line)
-    if not match:
-        continue
+BLOCK_SIZE = 1 << 20
+FOLLOW_POLL_INTERVAL = 0.05
+
+# Operates on whole blocks: `^` and `$` match at every line boundary
+EBM_RE = re.compile(rb'^(.*)EBM: \[([0-9A-Fa-f]{2}(?: [0-9A-Fa-f]{2})*)\](.*)$', re.MULTILINE)
+
+COLUMNS = ['prefix', 'raw', 'source', 'destination', 'type', 'logical_source', 'logical_destination',
+           'field', 'value', 'data', 'frame', 'suffix']
+DEFAULT_COLUMNS = ['prefix', 'raw', 'source', 'destination', 'type', 'logical_source', 'logical_destination',
+                   'field', 'value']
+
+
+def parse_int(value: str) -> int:
+    return int(value, 0)
+
+
+def parse_message_type(value: str) -> int:
+    try:
+        return ElcobusMessage.MessageType[value].value
+    except KeyError:
+        return parse_int(value)
+
+
+def parse_field(value: str) -> int:
+    try:
+        return Field[value].value
+    except KeyError:
+        return parse_int(value)
+
+
+parser = argparse.ArgumentParser(description='Decode the EBM: [..] frames in elcobus log files')
+parser.add_argument('--format', help="Output format", choices=['text', 'jsonl', 'csv'], default='text')
+parser.add_argument('--columns', help="Comma separated list of columns to output in jsonl or csv format. "
+                                      f"Available: {','.join(COLUMNS)}",
+                    type=lambda s: s.split(','), default=DEFAULT_COLUMNS)
+parser.add_argument('--type', help="Only output frames of this message type (name or number), may be repeated",
+                    type=parse_message_type, action='append')
+parser.add_argument('--field', help="Only output frames for this field (name or number), may be repeated",
+                    type=parse_field, action='append')
+parser.add_argument('--source', help="Only output frames from this bus address, may be repeated",
+                    type=parse_int, action='append')
+parser.add_argument('--destination', help="Only output frames to this bus address, may be repeated",
+                    type=parse_int, action='append')
+parser.add_argument('--follow', '-f', help="Keep reading the file as it grows, like `tail -f`",
+                    action='store_true')
+parser.add_argument('file', help="Log file(s) to read, defaults to stdin", nargs='*')
+
+
+class HeaderFilter:
+    """
+    Matches on the raw frame header, so frames can be discarded before they
+    are decoded.
+    """
+    def __init__(self, message_types=None, fields=None, sources=None, destinations=None):
+        self.message_types = set(message_types) if message_types else None
+        self.fields = set(fields) if fields else None
+        self.sources = set(sources) if sources else None
+        self.destinations = set(destinations) if destinations else None
+
+    def __bool__(self):
+        return any(f is not None for f in (self.message_types, self.fields, self.sources, self.destinations))
+
+    def __call__(self, frame: bytes) -> bool:
+        if len(frame) < 9:
+            return False
+        if self.sources is not None and frame[1] & 0x7f not in self.sources:
+            return False
+        if self.destinations is not None and frame[2] & 0x7f not in self.destinations:
+            return False
+        if self.message_types is not None and frame[4] not in self.message_types:
+            return False
+        if self.fields is not None and (frame[7] << 8 | frame[8]) not in self.fields:
+            return False
+        return True
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def decode(hexdump: bytes):
+    """
+    Decode a hexdump as found in the log.
+
+    Polling makes logs very repetitive, so results are cached.
+
+    :return: the decoded frame, or the exception raised while decoding
+    """
+    binary = binascii.unhexlify(hexdump.replace(b' ', b''))
+    try:
+        return ElcobusFrame.from_bytes(binary)
+    except (BufferError, ValueError) as e:
+        return e
+
+
+def data_value(data):
+    """
+    Returns the interesting part of a payload: the single non-constant
+    attribute, a dict if there are more, or a hexdump for undecoded data.
+    """
+    if data is None:
+        return None
+    if isinstance(data, (bytes, bytearray)):
+        return data.hex()
+    if not attr.has(type(data)):
+        return repr(data)
+
+    values = {
+        a.name: getattr(data, a.name)
+        for a in attr.fields(type(data))
+        if not a.name.startswith('_') and not isinstance(getattr(data, a.name), enum.Enum)
+    }
+    if len(values) == 1:
+        return next(iter(values.values()))
+    return values
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def frame_columns(hexdump: bytes) -> dict:
+    ebm = decode(hexdump)
+    columns = dict.fromkeys(COLUMNS)
+    columns['raw'] = hexdump.replace(b' ', b'').decode('ascii')
+    columns['frame'] = repr(ebm) if not isinstance(ebm, Exception) else f"invalid: {ebm}"
+
+    if isinstance(ebm, ElcobusMessage):
+        columns['source'] = ebm.source_address
+        columns['destination'] = ebm.destination_address
+        columns['type'] = ebm.message_type.name
+        columns['logical_source'] = ebm.logical_source
+        columns['logical_destination'] = ebm.logical_destination
+        columns['field'] = ebm.field.name if isinstance(ebm.field, Field) else f"0x{ebm.field:04x}"
+        columns['value'] = data_value(ebm.data)
+        columns['data'] = repr(ebm.data) if ebm.data is not None else None
+    elif isinstance(ebm, Exception):
+        columns['type'] = 'invalid'
+    else:
+        columns['type'] = 'unknown'
+        columns['data'] = ebm.data.hex()
+    return columns
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def text(hexdump: bytes) -> bytes:
+    ebm = decode(hexdump)
+    if isinstance(ebm, Exception):
+        return b"EBM: [" + hexdump + b"] invalid: " + str(ebm).encode('utf-8')
+    return b"EBM: " + repr(ebm).encode('utf-8')
+
+
+def json_default(o):
+    if isinstance(o, enum.Enum):
+        return o.name
+    return repr(o)
+
+
+class Formatter:
+    def __init__(self, output_format: str, columns: list):
+        self.format = output_format
+        self.columns = columns
+        self.header_pending = output_format == 'csv'
+
+    def format_matches(self, matches: list) -> bytes:
+        """
+        :param matches: list of (prefix, hexdump, suffix) tuples, as bytes
+        """
+        if self.format == 'text':
+            return b''.join(prefix + text(hexdump) + suffix + b'\n'
+                            for prefix, hexdump, suffix in matches)
+
+        rows = []
+        for prefix, hexdump, suffix in matches:
+            columns = frame_columns(hexdump)
+            row = {}
+            for name in self.columns:
+                if name == 'prefix':
+                    row[name] = prefix.decode('utf-8', 'replace')
+                elif name == 'suffix':
+                    row[name] = suffix.decode('utf-8', 'replace')
+                else:
+                    row[name] = columns[name]
+            rows.append(row)
+
+        if self.format == 'jsonl':
+            return ''.join(json.dumps(row, default=json_default) + '\n' for row in rows).encode('utf-8')
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.columns, lineterminator='\n')
+        if self.header_pending:
+            writer.writeheader()
+            self.header_pending = False
+        writer.writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+
+def process_block(block: bytes, header_filter: HeaderFilter, formatter: Formatter) -> bytes:
+    matches = EBM_RE.findall(block)
+    if header_filter:
+        matches = [
+            m for m in matches
+            if header_filter(binascii.unhexlify(m[1].replace(b' ', b'')))
+        ]
+    if not matches:
+        return b''
+    return formatter.format_matches(matches)
+
+
+class LineReader:
+    """
+    Splits what `read(BLOCK_SIZE)` returns into blocks of complete lines.
+    An unterminated last line is kept until the rest of it arrives, or until
+    `flush()` is called.
+
+    `idle` is set when the last read returned less than asked for, i.e. no
+    more data was available right away.
+    """
+    def __init__(self, read):
+        self.read = read
+        self.tail = b''
+        self.idle = False
+
+    def read_block(self) -> bytes:
+        """
+        :return: a block of complete lines, or b'' when no complete line is
+                 available (yet)
+        """
+        while True:
+            data = self.read(BLOCK_SIZE)
+            self.idle = len(data) < BLOCK_SIZE
+            if not data:
+                return b''
+
+            end = data.rfind(b'\n')
+            if end == -1:
+                self.tail += data
+                continue
+            block = self.tail + data[:end + 1]
+            self.tail = data[end + 1:]
+            return block
+
+    def flush(self) -> bytes:
+        tail, self.tail = self.tail, b''
+        return tail
+
+
+def read_until_eof(read):
+    """
+    Yields blocks until `read` returns nothing. Like `follow()`, yields an
+    empty block after a short read, so output is flushed while waiting on
+    e.g. a pipe.
+    """
+    reader = LineReader(read)
+    while True:
+        block = reader.read_block()
+        if not block:
+            break
+        yield block
+        if reader.idle:
+            yield b''
+    tail = reader.flush()
+    if tail:
+        yield tail
+
+
+def read_file(path: str):
+    with open(path, 'rb', buffering=0) as f:
+        yield from read_until_eof(f.read)
+
+
+def follow(path: str):
+    """
+    Yields blocks from `path`, waiting for more data at the end of the file.
+    Yields an empty block when waiting, so output can be flushed.
+    Re-opens the file when it is rotated or truncated.
+    """
+    f = open(path, 'rb', buffering=0)
+    try:
+        reader = LineReader(f.read)
+        while True:
+            block = reader.read_block()
+            if block:
+                yield block
+                continue
+
+            yield b''  # signals idle, so output is flushed
+
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                st = None
+            if st is not None and (st.st_ino != os.fstat(f.fileno()).st_ino or st.st_size < f.tell()):
+                # The old file was read completely; its last line won't be completed anymore
+                tail = reader.flush()
+                if tail:
+                    yield tail
+                f.close()
+                f = open(path, 'rb', buffering=0)
+                reader = LineReader(f.read)
+                continue
+            time.sleep(FOLLOW_POLL_INTERVAL)
+    finally:
+        f.close()
+
+
+def main():
+    args = parser.parse_args()
+
+    unknown_columns = set(args.columns) - set(COLUMNS)
+    if unknown_columns:
+        parser.error(f"Unknown column(s): {', '.join(sorted(unknown_columns))}")
+    if args.follow and len(args.file) != 1:
+        parser.error("--follow needs exactly one file")
+
+    header_filter = HeaderFilter(args.type, args.field, args.source, args.destination)
+    formatter = Formatter(args.format, args.columns)
+    output = open(sys.stdout.fileno(), 'wb', buffering=BLOCK_SIZE, closefd=False)
+
+    if args.follow:
+        sources = [follow(args.file[0])]
+    elif args.file:
+        sources = (read_file(path) for path in args.file)
+    else:
+        sources = [read_until_eof(sys.stdin.buffer.read1)]
 
-    hexdump = match.group(2)
-    binary = binascii.unhexlify(hexdump.replace(' ', ''))
-    ebm = ElcobusFrame.from_bytes(binary)
+    try:
+        for blocks in sources:
+            for block in blocks:
+                if block:
+                    output.write(process_block(block, header_filter, formatter))
+                else:
+                    output.flush()
+        output.flush()
+    except BrokenPipeError:
+        # Output was closed early (e.g. piped through `head`). Point stdout
+        # to /dev/null, so flushing at exit doesn't raise again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    except KeyboardInterrupt:
+        output.flush()
 
-    # optionally filter here?
 
-    print("{}EBM: {}{}".format(
-        match.group(1),
-        ebm,
-        match.group(3)))
+if __name__ == '__main__':
+    main()
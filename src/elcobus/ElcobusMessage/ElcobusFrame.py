@@ -4,9 +4,11 @@ import attr
 import bitstruct
 import crcmod
 import structattr
-from structattr.types import UInt, Enum, Bool, Zero, One, FixedPointSInt
+from structattr.types import UInt, Enum, Bool, Zero, One
 from typing import Union
 
+from . import _codegen
+
 
 crc_func = crcmod.mkCrcFun(0x11021, initCrc=0, xorOut=0, rev=False)
 
@@ -206,71 +208,49 @@ class UnknownFrame(ElcobusFrame):
         return result
 
 
-@structattr.add_methods
-@attr.s(slots=True, auto_attribs=True)
-class Temperature:
-    class Zero(Enum(8)):
-        Zero = 0
-    flag: Zero = Zero.Zero
-
-    temperature: FixedPointSInt(total_bits=16, fractional_bits=6) = 0
-
-
-@structattr.add_methods
-@attr.s(slots=True, auto_attribs=True)
-class RoomStatus:
-    temperature: FixedPointSInt(total_bits=16, fractional_bits=6) = 0
-    class Zero(Enum(8)):
-        Zero = 0
-    _unkn1: Zero = Zero.Zero
-
-
-@structattr.add_methods
-@attr.s(slots=True, auto_attribs=True)
-class Pressure:
-    class Zero(Enum(8)):
-        Zero = 0
-    flag: Zero = Zero.Zero
-
-    pressure: FixedPointSInt(total_bits=16, scale_factor=0.1) = 0
-
-
-@structattr.add_methods
-@attr.s(slots=True, auto_attribs=True)
-class Percent:
-    class Zero(Enum(8)):
-        Zero = 0
-    flag: Zero = Zero.Zero
-
-    percent: UInt(8) = 0
-
-
-@structattr.add_methods
-@attr.s(slots=True, auto_attribs=True)
-class Status:
-    class Zero(Enum(8)):
-        Zero = 0
-    flag: Zero = Zero.Zero
-    status: UInt(8) = 0
-
-
-class Field(int, enum.Enum):
-    def __new__(cls, value: int, data_type: type):
+# Payload types, see `_codegen` for the syntax
+DATA_TYPES = """
+Temperature  flag:u8=0  temperature:s16/64  unit=°C  class=temperature
+RoomStatus   temperature:s16/64  _unkn1:u8=0  unit=°C  class=temperature
+Pressure     flag:u8=0  pressure:s16/10  unit=bar  class=pressure
+Percent      flag:u8=0  percent:u8  unit=%
+Status       flag:u8=0  status:u8
+"""
+
+# Field number, name and payload type, optionally followed by
+# `circuits=N` for fields that exist once per heating circuit. Those use
+# logical address 0x20 + circuit number.
+FIELDS = """
+0x0215  RoomStatus                    RoomStatus
+0x0521  OutdoorTemperature            Temperature
+0x0519  BoilerTemperature             Temperature
+0x0923  BoilerSetTemperature          Temperature
+0x051a  BoilerReturnTemperature       Temperature
+0x052f  TapWaterTemperature           Temperature
+0x074b  TapWaterSetTemperature        Temperature
+0x0518  HeatingCircuitTemperature     Temperature  circuits=2
+0x0667  HeatingCircuitSetTemperature  Temperature  circuits=2
+0x3063  Pressure                      Pressure
+0x305f  BurnerModulation              Percent
+0x04a2  PumpModulation                Percent
+0x3034  Status                        Status
+"""
+
+payload_types = _codegen.make_payload_types(DATA_TYPES, module=__name__)
+Temperature = payload_types['Temperature']
+RoomStatus = payload_types['RoomStatus']
+Pressure = payload_types['Pressure']
+Percent = payload_types['Percent']
+Status = payload_types['Status']
+
+
+class _Field(int, enum.Enum):
+    def __new__(cls, value: int, data_type: type, options: dict = None):
         o = int.__new__(cls, value)
         o._value_ = value
         o.data_type = data_type
+        o.circuits = int((options or {}).get('circuits', 0))
         return o
 
-    RoomStatus = (0x0215, RoomStatus)
-    OutdoorTemperature = (0x0521, Temperature)
-    BoilerTemperature = (0x0519, Temperature)
-    BoilerSetTemperature = (0x0923, Temperature)
-    BoilerReturnTemperature = (0x051a, Temperature)
-    TapWaterTemperature = (0x052f, Temperature)
-    TapWaterSetTemperature = (0x074b, Temperature)
-    HeatingCircuitTemperature = (0x0518, Temperature)  # note: logical address denote circuits: 0x20 + circuit number
-    HeatingCircuitSetTemperature = (0x0667, Temperature)  # note: logical address denote circuits: 0x20 + circuit number
-    Pressure = (0x3063, Pressure)
-    BurnerModulation = (0x305f, Percent)
-    PumpModulation = (0x04a2, Percent)
-    Status = (0x3034, Status)
+
+Field = _Field('Field', _codegen.parse_fields(FIELDS, payload_types), module=__name__)
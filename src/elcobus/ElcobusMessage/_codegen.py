@@ -0,0 +1,221 @@
+"""
+Generates payload classes from a compact schema.
+
+Each payload type is described on a single line: its name, followed by one
+`attribute:type` per struct member, in wire order (big endian):
+
+    Temperature  flag:u8=0  temperature:s16/64
+
+`type` is one of u8, s8, u16, s16, u32, s32, optionally followed by
+`=value` for a constant member (exposed as a single-member enum, like
+structattr does), or `/divisor` for a fixed-point value.
+
+Tokens of the form `key=value` (without a colon) set class attributes
+describing the value, e.g. `unit=°C class=temperature`; see `METADATA`.
+The single public, non-constant member is recorded in `value_attribute`.
+
+The generated classes are plain attrs classes. Their `from_bytes()`,
+`to_bytes()` and `__len__()` are generated as source code for each type,
+with the `struct` format and scale factors as constants, so decoding
+doesn't go through any reflection.
+"""
+import enum
+import linecache
+import re
+import struct
+import typing
+
+import attr
+
+
+STRUCT_FORMATS = {
+    'u8': 'B', 's8': 'b',
+    'u16': 'H', 's16': 'h',
+    'u32': 'I', 's32': 'i',
+}
+
+# schema key -> class attribute, default
+METADATA = {
+    'unit': ('unit', None),
+    'class': ('device_class', None),
+}
+
+MEMBER_RE = re.compile(r'(?P<name>[A-Za-z_][A-Za-z0-9_]*)'
+                       r':(?P<type>[us](?:8|16|32))'
+                       r'(?:=(?P<const>-?(?:0x[0-9A-Fa-f]+|\d+))|/(?P<divisor>\d+))?')
+
+
+@attr.s(slots=True, auto_attribs=True, frozen=True)
+class Member:
+    name: str
+    format: str
+    const: typing.Optional[int] = None
+    divisor: typing.Optional[int] = None
+
+
+def _strip_comments(schema: str) -> typing.Iterator[typing.List[str]]:
+    for line in schema.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            yield line.split()
+
+
+def parse_members(tokens: typing.Iterable[str]) -> typing.List[Member]:
+    members = []
+    for token in tokens:
+        match = MEMBER_RE.fullmatch(token)
+        if match is None:
+            raise ValueError(f"Invalid member specification `{token}`")
+        members.append(Member(
+            name=match.group('name'),
+            format=STRUCT_FORMATS[match.group('type')],
+            const=int(match.group('const'), 0) if match.group('const') is not None else None,
+            divisor=int(match.group('divisor')) if match.group('divisor') is not None else None,
+        ))
+    return members
+
+
+def _const_enum(member: Member) -> type:
+    name = 'Zero' if member.const == 0 else 'Const'
+    return enum.Enum(name, [(name, member.const)])
+
+
+def parse_options(tokens: typing.Iterable[str], allowed: typing.Iterable[str]) -> typing.Dict[str, str]:
+    options = {}
+    for token in tokens:
+        key, sep, value = token.partition('=')
+        if not sep or key not in allowed:
+            raise ValueError(f"Invalid option `{token}`")
+        options[key] = value
+    return options
+
+
+def make_payload_type(
+        name: str,
+        members: typing.List[Member],
+        module: str = __name__,
+        metadata: typing.Dict[str, str] = None,
+) -> type:
+    """
+    Create an attrs class `name` with generated `from_bytes()` and
+    `to_bytes()` methods.
+    """
+    const_enums = {}
+    attributes = {}
+    for member in members:
+        if member.const is not None:
+            const_enum = _const_enum(member)
+            const_enum.__qualname__ = f"{name}.{const_enum.__name__}"
+            const_enum.__module__ = module
+            const_enums[member.name] = const_enum
+            attributes[member.name] = attr.ib(type=const_enum, default=const_enum(member.const))
+        elif member.divisor is not None:
+            attributes[member.name] = attr.ib(type=float, default=0)
+        else:
+            attributes[member.name] = attr.ib(type=int, default=0)
+
+    cls = attr.make_class(name, attributes, slots=True)
+    cls.__module__ = module
+    for const_enum in const_enums.values():
+        setattr(cls, const_enum.__name__, const_enum)
+
+    packer = struct.Struct('>' + ''.join(m.format for m in members))
+    names = [f"v_{m.name.lstrip('_')}" for m in members]
+
+    decode_args = []
+    checks = []
+    encode_args = []
+    for member, var in zip(members, names):
+        if member.const is not None:
+            checks.append(f"    if {var} != {member.const}:\n"
+                          f"        raise ValueError(f\"{name}.{member.name}: expected {member.const}, "
+                          f"got {{{var}}}\")")
+            decode_args.append(f"c_{var}")
+            encode_args.append(f"{member.const}")
+        elif member.divisor is not None:
+            decode_args.append(f"{var} / {member.divisor}")
+            encode_args.append(f"round(self.{member.name} * {member.divisor})")
+        else:
+            decode_args.append(var)
+            encode_args.append(f"self.{member.name}")
+
+    source = "\n".join([
+        "def from_bytes(cls, data):",
+        f"    if len(data) != {packer.size}:",
+        f"        raise ValueError(f\"{name}: expected {packer.size} bytes, got {{len(data)}}\")",
+        f"    {', '.join(names)}, = unpack(data)",
+        *checks,
+        f"    return cls({', '.join(decode_args)})",
+        "",
+        "def to_bytes(self):",
+        f"    return pack({', '.join(encode_args)})",
+        "",
+        "def __len__(self):",  # used by ElcobusMessage.to_bytes()
+        f"    return {packer.size}",
+        "",
+    ])
+    namespace = {
+        'pack': packer.pack,
+        'unpack': packer.unpack,
+    }
+    for member, var in zip(members, names):
+        if member.const is not None:
+            namespace[f"c_{var}"] = const_enums[member.name](member.const)
+
+    # Make the source available to tracebacks and inspect, like attrs does
+    filename = f"<elcobus generated {module}.{name}>"
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    exec(compile(source, filename, 'exec'), namespace)
+
+    cls.from_bytes = classmethod(namespace['from_bytes'])
+    cls.to_bytes = namespace['to_bytes']
+    cls.__len__ = namespace['__len__']
+    cls._struct = packer
+
+    values = [m.name for m in members if m.const is None and not m.name.startswith('_')]
+    cls.value_attribute = values[0] if len(values) == 1 else None
+    if metadata is None:
+        metadata = {}
+    for key, (attribute, default) in METADATA.items():
+        setattr(cls, attribute, metadata.get(key, default))
+
+    return cls
+
+
+def make_payload_types(schema: str, module: str = __name__) -> typing.Dict[str, type]:
+    """
+    Create a payload class for every line in `schema`.
+    """
+    types = {}
+    for name, *tokens in _strip_comments(schema):
+        members = [t for t in tokens if ':' in t]
+        options = [t for t in tokens if ':' not in t]
+        types[name] = make_payload_type(name, parse_members(members), module,
+                                        parse_options(options, METADATA))
+    return types
+
+
+FIELD_OPTIONS = {'circuits'}
+
+
+def parse_fields(
+        schema: str,
+        data_types: typing.Dict[str, type],
+) -> typing.List[typing.Tuple[str, typing.Tuple[int, type, typing.Dict[str, str]]]]:
+    """
+    Parse a field schema, one field per line, optionally followed by
+    `key=value` options (see `FIELD_OPTIONS`):
+
+        0x0521  OutdoorTemperature  Temperature
+        0x0518  HeatingCircuitTemperature  Temperature  circuits=2
+
+    :return: list of (name, (number, data type, options)), as accepted by
+             the enum functional API
+    """
+    fields = []
+    for tokens in _strip_comments(schema):
+        if len(tokens) < 3:
+            raise ValueError(f"Invalid field specification `{' '.join(tokens)}`")
+        number, name, data_type, *options = tokens
+        fields.append((name, (int(number, 0), data_types[data_type], parse_options(options, FIELD_OPTIONS))))
+    return fields
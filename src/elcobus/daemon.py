@@ -0,0 +1,352 @@
+import asyncio
+import dataclasses
+import json
+import logging
+import random
+import re
+import typing
+
+from paho.mqtt import client as mqtt
+
+from .ElcobusMessage import ElcobusFrame
+from .discovery import Discovery, state_topic
+from .framestore import FrameStore, json_query
+from .polling import FixedPolicy
+from .profiling import StageTimers
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass()
+class MqttConnectionDetails:
+    protocol: str
+    username: typing.Optional[str]
+    password: typing.Optional[str]
+    host: str
+    port: int
+    topic: str
+
+    @classmethod
+    def from_uri(cls, uri: str) -> "MqttConnectionDetails":
+        mqtt_component_match = re.fullmatch(r'(?P<protocol>mqtt)://'
+                                            r'((?P<username>[^:@]+)(:(?P<password>[^@]*)?@))?'
+                                            r'(?P<host>[^/:]+)'
+                                            r'(:(?P<port>\d+))?'
+                                            r'(/(?P<topic>.*))?', uri)
+        mqtt_component = mqtt_component_match.groupdict()
+
+        if mqtt_component['port'] is None:
+            mqtt_component['port'] = 1883
+        else:
+            mqtt_component['port'] = int(mqtt_component['port'])
+
+        ret = cls(**mqtt_component)
+        logger.debug("Parsed MQTT URI as: " + repr(ret))
+        return ret
+
+
+class PahoMqttAsyncioHelper:
+    def __init__(self, client, loop, timers: StageTimers):
+        self.client = client
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+        self.loop = loop
+        self.timers = timers
+
+    def on_socket_open(self, client, userdata, sock):
+        logger.info("MQTT Socket opened")
+
+        def cb():
+            # print("Socket is readable, calling loop_read")
+            with self.timers.time('paho_read'):
+                client.loop_read()
+
+        self.loop.add_reader(sock, cb)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        logger.info("MQTT Socket closed")
+        self.loop.remove_reader(sock)
+        self.misc.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        # print("Watching socket for writability.")
+
+        def cb():
+            # print("Socket is writable, calling loop_write")
+            client.loop_write()
+
+        self.loop.add_writer(sock, cb)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        # print("Stop watching socket for writability.")
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        # print("misc_loop started")
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+        # print("misc_loop finished")
+
+
+class MqttClient:
+    """
+    Keeps a connection to the broker, reconnecting when it drops, and hands
+    the connection events and incoming messages to `daemon`.
+    """
+    def __init__(
+            self,
+            mqtt_connection_details: MqttConnectionDetails,
+            daemon: "Daemon",
+            loop: asyncio.AbstractEventLoop = None,
+            client_factory: typing.Callable[[], mqtt.Client] = mqtt.Client,
+    ):
+        self.connection_details = mqtt_connection_details
+        self.daemon = daemon
+        self.client_factory = client_factory
+
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+
+        self.client = None
+        self.aio_helper = None
+
+    def _connect(self) -> None:
+        if self.client is not None and self.client.is_connected():
+            self.client.disconnect()
+
+        self.client = self.client_factory()
+        self.aio_helper = PahoMqttAsyncioHelper(self.client, self.loop, self.daemon.timers)
+
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.on_disconnect = self.on_disconnect
+
+        self.client.will_set(self.daemon.status_topic, 'offline', qos=1, retain=True)
+
+        if self.connection_details.username is not None:
+            self.client.username_pw_set(
+                username=self.connection_details.username,
+                password=self.connection_details.password,
+            )
+        self.client.connect(
+            host=self.connection_details.host,
+            port=self.connection_details.port
+        )
+
+    def get_mqtt_client(self):
+        return self.client
+
+    async def main(self):
+        self._connect()
+
+        while True:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+    def on_connect(self, client: mqtt.Client, user_data, flags, rc):
+        self.daemon.on_connect(client)
+
+    def on_disconnect(self, client: mqtt.Client, user_data, rc):
+        self.loop.call_soon(self.attempt_reconnect)  # Will deadlock if called from here
+
+    def attempt_reconnect(self):
+        try:
+            logger.info("Attempting reconnect...")
+            self._connect()
+        except (ConnectionRefusedError, OSError):
+            timeout = 1
+            logger.warning(f"Reconnect failed, retrying in {timeout} seconds")
+            self.loop.call_later(delay=timeout, callback=self.attempt_reconnect)
+
+    def on_message(self, client: mqtt.Client, user_data, msg: mqtt.MQTTMessage):
+        with self.daemon.timers.time('on_message'):
+            self.daemon.on_message(msg)
+
+
+class Daemon:
+    """
+    Decodes the frames the bus gateway publishes on `<topic>/bus_rx`,
+    publishes their values as retained state under `topic_prefix`, and polls
+    datapoints by publishing requests on `<topic>/bus_tx` (see
+    `poll_every()`), where `<topic>` comes from the connection details.
+
+    Run `main()` to connect and stay connected.
+    """
+    def __init__(
+            self,
+            mqtt_connection_details: MqttConnectionDetails,
+            topic_prefix: str = 'elcobus',
+            poll_policy: FixedPolicy = None,
+            discovery: Discovery = None,
+            frame_store: FrameStore = None,
+            timers: StageTimers = None,
+            loop: asyncio.AbstractEventLoop = None,
+            client_factory: typing.Callable[[], mqtt.Client] = mqtt.Client,
+    ):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+
+        if poll_policy is None:
+            poll_policy = FixedPolicy()
+        if timers is None:
+            timers = StageTimers()
+
+        self.bus_topic = mqtt_connection_details.topic
+        self.topic_prefix = topic_prefix
+        self.poll_policy = poll_policy
+        self.discovery = discovery
+        self.frame_store = frame_store
+        self.timers = timers
+
+        self.mqtt_client = MqttClient(mqtt_connection_details, self, loop, client_factory)
+
+    @property
+    def status_topic(self) -> str:
+        return self.topic_prefix + '/status'
+
+    @property
+    def history_query_topic(self) -> str:
+        return self.topic_prefix + '/history/query'
+
+    async def main(self):
+        await self.mqtt_client.main()
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.mqtt_client.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def on_connect(self, client: mqtt.Client):
+        client.subscribe(self.bus_topic + '/bus_rx', 2)
+        if self.frame_store is not None:
+            client.subscribe(self.history_query_topic, 1)
+
+        client.publish(self.status_topic, 'online', qos=1, retain=True)
+        if self.discovery is not None:
+            self.discovery.on_connect()
+
+    def on_message(self, msg: mqtt.MQTTMessage):
+        if msg.topic == self.history_query_topic:
+            self.process_history_query(msg.payload)
+            return
+
+        try:
+            with self.timers.time('decode'):
+                ebm = ElcobusFrame.ElcobusFrame.from_bytes(msg.payload)
+            with self.timers.time('log'):
+                logger.info(f"Rx: [{' '.join(['{:02x}'.format(b) for b in ebm.to_bytes()])}]")
+                logger.debug("Rx:  %r", ebm)
+                # ^^ don't use ''.format()
+                # This allows the repr(ebm) call to be omitted if the message is discarded
+
+        except BufferError:
+            logger.warning("Invalid message: too short?")
+            return
+
+        except ValueError as e:
+            logger.warning("Invalid message: {e}".format(
+                e=e,
+            ))
+            return
+
+        if self.frame_store is not None:
+            with self.timers.time('store'):
+                self.frame_store.append(msg.payload[0:msg.payload[3]])
+
+        with self.timers.time('dispatch'):
+            self.process_frame(ebm)
+
+    def process_history_query(self, payload: bytes):
+        try:
+            request = json.loads(payload)
+            if not isinstance(request, dict):
+                raise ValueError("query must be a JSON object")
+        except ValueError as e:
+            logger.warning(f"Invalid history query: {e}")
+            return
+
+        result = json_query(self.frame_store, request)
+        self.publish(self.topic_prefix + '/history/result', json.dumps(result), qos=1)
+
+    def process_frame(self, ebm: ElcobusFrame.ElcobusFrame):
+        if not isinstance(ebm, ElcobusFrame.ElcobusMessage):
+            return
+        if ebm.message_type not in {
+            ElcobusFrame.ElcobusMessage.MessageType.Info,
+            ElcobusFrame.ElcobusMessage.MessageType.Ret,
+        }:
+            return
+
+        if not isinstance(ebm.field, ElcobusFrame.Field) or not isinstance(ebm.data, ebm.field.data_type):
+            return  # unknown field, or payload could not be decoded
+        if ebm.data.value_attribute is None:
+            return
+
+        circuit = None
+        if ebm.field.circuits:
+            circuit = ebm.logical_source - 32  # 33 => 1, 34 => 2
+            if not 1 <= circuit <= ebm.field.circuits:
+                logger.debug("Ignoring %s from logical address 0x%02x: not a circuit",
+                             ebm.field.name, ebm.logical_source)
+                return
+
+        with self.timers.time('publish'):
+            # Retained, so subscribers get the current value immediately instead of after the next poll
+            self.publish(state_topic(self.topic_prefix, ebm.field, circuit),
+                         getattr(ebm.data, ebm.data.value_attribute), qos=1, retain=True)
+
+        self.poll_policy.observe((ebm.field, ebm.logical_source), getattr(ebm.data, ebm.data.value_attribute))
+
+    async def poll_every(
+            self,
+            interval_secs: float,
+            ebm: ElcobusFrame.ElcobusMessage,
+            min_interval: float = None,
+            max_interval: float = None,
+            resolution: float = 1.0,
+    ):
+        """
+        Poll `ebm` every `interval_secs`, or within [min_interval, max_interval]
+        (default: a quarter to five times `interval_secs`) when the poll policy
+        is adaptive. The adaptive policy aims to poll about once per change of
+        `resolution` in the value.
+        """
+        key = (ebm.field, ebm.logical_destination)  # matches the logical_source of the reply
+        self.poll_policy.add(
+            key, interval_secs,
+            min_interval=min_interval if min_interval is not None else interval_secs / 4,
+            max_interval=max_interval if max_interval is not None else interval_secs * 5,
+            resolution=resolution,
+        )
+
+        circuit = None
+        if ebm.field.circuits:
+            circuit = ebm.logical_destination - 32
+        metrics_topic = state_topic(self.topic_prefix + '/metrics/poll_interval', ebm.field, circuit)
+
+        await asyncio.sleep(random.uniform(0, interval_secs))  # stagger the calls
+        while True:
+            interval = self.poll_policy.interval(key)
+            await asyncio.sleep(interval + random.uniform(-interval/10, interval/10))
+            self.publish(self.bus_topic + '/bus_tx', ebm.to_bytes(), qos=2)
+            # Reply is automatically processed in process_frame, even if it is unsollicited
+
+            self.publish(metrics_topic, round(self.poll_policy.interval(key), 1), qos=0, retain=True)
+
+    async def publish_poll_rate_every(self, interval_secs: float):
+        while True:
+            try:
+                await asyncio.sleep(interval_secs)
+            except asyncio.CancelledError:
+                break
+            self.publish(self.topic_prefix + '/metrics/poll_rate', round(self.poll_policy.poll_rate(), 4),
+                         qos=0, retain=True)
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+import typing
+
+from .ElcobusMessage import ElcobusFrame
+
+
+logger = logging.getLogger(__name__)
+
+
+def state_topic(prefix: str, field: ElcobusFrame.Field, circuit: typing.Optional[int] = None) -> str:
+    if circuit is None:
+        return prefix + '/' + field.name
+    return prefix + '/' + field.name + f" {circuit}"
+
+
+class Discovery:
+    """
+    Publishes Home Assistant MQTT discovery messages for the fields in the
+    `Field` registry: one sensor per field, or one per circuit for fields
+    with `circuits`.
+
+    Config messages are retained. They are published again on every
+    connect, since a broker restarted without persistence has lost them.
+    Publishing is rate-limited to once every `min_interval` seconds.
+    """
+    def __init__(
+            self,
+            publish: typing.Callable[..., typing.Any],
+            state_prefix: str,
+            discovery_prefix: str = 'homeassistant',
+            node_id: str = 'elcobus',
+            min_interval: float = 10.0,
+            loop: asyncio.AbstractEventLoop = None,
+    ):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+
+        self.publish = publish
+        self.state_prefix = state_prefix
+        self.discovery_prefix = discovery_prefix
+        self.node_id = node_id
+        self.min_interval = min_interval
+
+        self.entities = set()  # (field, circuit)
+        self.published = set()
+        for field in ElcobusFrame.Field:
+            if field.circuits:
+                for circuit in range(1, field.circuits + 1):
+                    self.entities.add((field, circuit))
+            else:
+                self.entities.add((field, None))
+
+        self._last_flush = None
+        self._flush_handle = None
+
+    @property
+    def availability_topic(self) -> str:
+        return self.state_prefix + '/status'
+
+    def config_topic(self, field: ElcobusFrame.Field, circuit: typing.Optional[int]) -> str:
+        return f"{self.discovery_prefix}/sensor/{self.node_id}/{self.object_id(field, circuit)}/config"
+
+    def object_id(self, field: ElcobusFrame.Field, circuit: typing.Optional[int]) -> str:
+        if circuit is None:
+            return field.name
+        return f"{field.name}_{circuit}"
+
+    def config(self, field: ElcobusFrame.Field, circuit: typing.Optional[int]) -> dict:
+        config = {
+            'name': field.name if circuit is None else f"{field.name} {circuit}",
+            'unique_id': f"{self.node_id}_{self.object_id(field, circuit)}",
+            'state_topic': state_topic(self.state_prefix, field, circuit),
+            'availability_topic': self.availability_topic,
+            'device': {
+                'identifiers': [self.node_id],
+                'name': self.node_id,
+            },
+        }
+        data_type = field.data_type
+        if data_type.unit is not None:
+            config['unit_of_measurement'] = data_type.unit
+            config['state_class'] = 'measurement'
+        if data_type.device_class is not None:
+            config['device_class'] = data_type.device_class
+        return config
+
+    def on_connect(self) -> None:
+        self.published.clear()
+        self.schedule()
+
+    def schedule(self) -> None:
+        if self._flush_handle is not None:
+            return  # already scheduled
+        if not self.entities - self.published:
+            return
+
+        delay = 0.0
+        if self._last_flush is not None:
+            delay = max(0.0, self._last_flush + self.min_interval - self.loop.time())
+        self._flush_handle = self.loop.call_later(delay, self.flush)
+
+    def flush(self) -> None:
+        self._flush_handle = None
+        self._last_flush = self.loop.time()
+
+        pending = sorted(self.entities - self.published, key=lambda e: (e[0].name, e[1] or 0))
+        if not pending:
+            return
+        logger.info(f"Publishing discovery config for {len(pending)} entities")
+        for field, circuit in pending:
+            self.publish(self.config_topic(field, circuit), json.dumps(self.config(field, circuit)),
+                         qos=1, retain=True)
+            self.published.add((field, circuit))
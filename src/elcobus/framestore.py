@@ -0,0 +1,268 @@
+import array
+import itertools
+import time
+import typing
+
+from .ElcobusMessage import ElcobusFrame
+
+
+MAX_FRAME_LENGTH = 32  # ElcobusFrame.from_bytes() rejects longer frames
+
+# Results per JSON query page; every result is decoded and published in one message
+DEFAULT_QUERY_LIMIT = 20
+MAX_QUERY_LIMIT = 200
+
+# Message types that carry a value
+VALUE_TYPES = {
+    ElcobusFrame.ElcobusMessage.MessageType.Info.value,
+    ElcobusFrame.ElcobusMessage.MessageType.Set.value,
+    ElcobusFrame.ElcobusMessage.MessageType.Ret.value,
+}
+GET = ElcobusFrame.ElcobusMessage.MessageType.Get.value
+RET = ElcobusFrame.ElcobusMessage.MessageType.Ret.value
+
+
+class FrameStore:
+    """
+    Ring buffer holding the last `capacity` frames.
+
+    Frames are kept as raw bytes in fixed-size slots, with the header fields
+    copied into parallel `array` columns, so queries don't need to decode
+    anything. That's 48 bytes per frame. Frames are only decoded when they
+    are returned.
+
+    Every appended frame gets a sequence number; frame `seq` lives in slot
+    `seq % capacity` until it is overwritten.
+
+    Time range queries bisect on the timestamps, so these never decrease: a
+    frame stamped earlier than its predecessor (e.g. after the wall clock
+    was stepped back) gets the predecessor's timestamp instead.
+    """
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+
+        self._raw = bytearray(capacity * MAX_FRAME_LENGTH)
+        self._length = array.array('B', bytes(capacity))
+        self._timestamp = array.array('d', [0.0]) * capacity
+        self._message_type = array.array('B', bytes(capacity))
+        self._source = array.array('B', bytes(capacity))
+        self._destination = array.array('B', bytes(capacity))
+        self._logical_source = array.array('B', bytes(capacity))
+        self._logical_destination = array.array('B', bytes(capacity))
+        self._field = array.array('H', [0]) * capacity
+
+        self._count = 0  # sequence number of the next frame
+        self._last_timestamp = 0.0
+        self._last = {}  # (field, logical_source) -> sequence number
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+    @property
+    def first_seq(self) -> int:
+        return max(self._count - self.capacity, 0)
+
+    def append(self, frame: bytes, timestamp: float = None) -> int:
+        """
+        Store `frame` (raw bytes, including CRC).
+
+        :return: the sequence number of the frame
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if timestamp < self._last_timestamp:
+            timestamp = self._last_timestamp
+        self._last_timestamp = timestamp
+
+        seq = self._count
+        slot = seq % self.capacity
+        length = min(len(frame), MAX_FRAME_LENGTH)
+
+        offset = slot * MAX_FRAME_LENGTH
+        self._raw[offset:offset + length] = frame[0:length]
+        self._length[slot] = length
+        self._timestamp[slot] = timestamp
+
+        if length >= 9:
+            self._source[slot] = frame[1] & 0x7f
+            self._destination[slot] = frame[2] & 0x7f
+            self._message_type[slot] = frame[4]
+            self._logical_source[slot] = frame[5]
+            self._logical_destination[slot] = frame[6]
+            self._field[slot] = frame[7] << 8 | frame[8]
+            if frame[4] in VALUE_TYPES:
+                self._last[(self._field[slot], frame[5])] = seq
+        else:
+            self._source[slot] = self._destination[slot] = self._message_type[slot] = 0
+            self._logical_source[slot] = self._logical_destination[slot] = self._field[slot] = 0
+
+        self._count += 1
+        return seq
+
+    def raw(self, seq: int) -> bytes:
+        self._check_seq(seq)
+        slot = seq % self.capacity
+        offset = slot * MAX_FRAME_LENGTH
+        return bytes(self._raw[offset:offset + self._length[slot]])
+
+    def timestamp(self, seq: int) -> float:
+        self._check_seq(seq)
+        return self._timestamp[seq % self.capacity]
+
+    def frame(self, seq: int) -> ElcobusFrame.ElcobusFrame:
+        """
+        Decode frame `seq`.
+
+        :raises ValueError when the frame is invalid
+        :raises IndexError when the frame is not (or no longer) stored
+        """
+        return ElcobusFrame.ElcobusFrame.from_bytes(self.raw(seq))
+
+    def _check_seq(self, seq: int) -> None:
+        if not self.first_seq <= seq < self._count:
+            raise IndexError(f"Frame {seq} is not in the store")
+
+    def last(self, field: int, logical_source: int = None) -> typing.Optional[int]:
+        """
+        Find the most recent Info, Set or Ret frame for `field`, optionally
+        only from `logical_source` (e.g. the heating circuit).
+
+        :return: sequence number, or None
+        """
+        if logical_source is not None:
+            candidates = [self._last.get((field, logical_source))]
+        else:
+            candidates = [seq for (f, _), seq in self._last.items() if f == field]
+
+        candidates = [seq for seq in candidates if seq is not None and seq >= self.first_seq]
+        if not candidates:
+            return None
+        return max(candidates)
+
+    def _bisect(self, t: float) -> int:
+        """
+        Returns the first sequence number with a timestamp >= `t`.
+        """
+        lo, hi = self.first_seq, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamp[mid % self.capacity] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def between(self, t1: float = None, t2: float = None) -> range:
+        """
+        :return: the sequence numbers of all frames with t1 <= timestamp < t2
+        """
+        start = self.first_seq if t1 is None else self._bisect(t1)
+        end = self._count if t2 is None else self._bisect(t2)
+        return range(start, max(start, end))
+
+    def pairs(self, t1: float = None, t2: float = None) -> typing.Iterator[typing.Tuple[int, int]]:
+        """
+        Match Get requests with their Ret replies.
+
+        :return: iterator of (request seq, reply seq)
+        """
+        pending = {}
+        for seq in self.between(t1, t2):
+            slot = seq % self.capacity
+            message_type = self._message_type[slot]
+            if message_type == GET:
+                key = (self._source[slot], self._destination[slot],
+                       self._logical_source[slot], self._logical_destination[slot],
+                       self._field[slot])
+                pending[key] = seq
+            elif message_type == RET:
+                key = (self._destination[slot], self._source[slot],
+                       self._logical_destination[slot], self._logical_source[slot],
+                       self._field[slot])
+                request = pending.pop(key, None)
+                if request is not None:
+                    yield request, seq
+
+
+def _field_number(field) -> int:
+    if isinstance(field, int):
+        return field
+    try:
+        return ElcobusFrame.Field[field].value
+    except KeyError:
+        return int(field, 0)
+
+
+def json_query(store: FrameStore, request: dict) -> dict:
+    """
+    Answers a query in its JSON form:
+
+      {"query": "last", "field": "Pressure"}
+      {"query": "last", "field": "HeatingCircuitTemperature", "circuit": 1}
+      {"query": "between", "from": 1600000000, "to": 1600000060}
+      {"query": "pairs", "from": 1600000000}
+
+    `field` is a `Field` name or number. `id`, when present, is copied to
+    the result.
+
+    `between` and `pairs` return at most `limit` results (default
+    `DEFAULT_QUERY_LIMIT`, at most `MAX_QUERY_LIMIT`). When there are more,
+    the result contains `next`: repeat the query with `"start": next` to get
+    the next page.
+    """
+    def describe(seq: int) -> dict:
+        raw = store.raw(seq)
+        try:
+            decoded = repr(ElcobusFrame.ElcobusFrame.from_bytes(raw))
+        except (BufferError, ValueError) as e:
+            decoded = f"invalid: {e}"
+        return {
+            'seq': seq,
+            'time': store.timestamp(seq),
+            'raw': raw.hex(),
+            'frame': decoded,
+        }
+
+    result = {}
+    if 'id' in request:
+        result['id'] = request['id']
+
+    try:
+        query = request['query']
+        limit = min(max(int(request.get('limit', DEFAULT_QUERY_LIMIT)), 1), MAX_QUERY_LIMIT)
+        start = int(request['start']) if request.get('start') is not None else None
+        if query == 'last':
+            logical_source = None
+            if request.get('circuit') is not None:
+                logical_source = 0x20 + int(request['circuit'])
+            seq = store.last(_field_number(request['field']), logical_source)
+            result['frames'] = [describe(seq)] if seq is not None else []
+        elif query == 'between':
+            seqs = store.between(request.get('from'), request.get('to'))
+            if start is not None:
+                seqs = seqs[max(start - seqs.start, 0):]
+            page = seqs[0:limit + 1]
+            result['frames'] = [describe(seq) for seq in page[0:limit]]
+            if len(page) > limit:
+                result['next'] = page[limit]
+        elif query == 'pairs':
+            # Pairs come out ordered by reply; page on that, since a request
+            # can precede the start of the page.
+            pairs = store.pairs(request.get('from'), request.get('to'))
+            if start is not None:
+                pairs = ((request_seq, reply_seq) for request_seq, reply_seq in pairs if reply_seq >= start)
+            page = list(itertools.islice(pairs, limit + 1))
+            result['pairs'] = [
+                {'request': describe(request_seq), 'reply': describe(reply_seq)}
+                for request_seq, reply_seq in page[0:limit]
+            ]
+            if len(page) > limit:
+                result['next'] = page[limit][1]
+        else:
+            raise ValueError(f"Unknown query `{query}`")
+    except (KeyError, TypeError, ValueError) as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+
+    return result
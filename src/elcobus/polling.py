@@ -0,0 +1,138 @@
+import dataclasses
+import logging
+import time
+import typing
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass()
+class Datapoint:
+    interval: float  # nominal interval, used as-is by FixedPolicy
+    min_interval: float
+    max_interval: float
+    resolution: float  # change in value that warrants a poll
+
+    current_interval: float = None
+    rate: typing.Optional[float] = None  # smoothed |d value / dt|
+    last_value: typing.Optional[float] = None
+    last_time: typing.Optional[float] = None
+
+    def __post_init__(self):
+        if self.current_interval is None:
+            self.current_interval = self.interval
+
+
+class FixedPolicy:
+    """
+    Polls every datapoint at its nominal interval.
+    """
+    def __init__(self):
+        self.datapoints = {}  # key -> Datapoint
+
+    def add(
+            self,
+            key: typing.Hashable,
+            interval: float,
+            min_interval: float = None,
+            max_interval: float = None,
+            resolution: float = 1.0,
+    ) -> None:
+        if min_interval is None:
+            min_interval = interval
+        if max_interval is None:
+            max_interval = interval
+        self.datapoints[key] = Datapoint(interval, min_interval, max_interval, resolution)
+
+    def observe(self, key: typing.Hashable, value: float, timestamp: float = None) -> None:
+        pass
+
+    def interval(self, key: typing.Hashable) -> float:
+        return self.datapoints[key].current_interval
+
+    def intervals(self) -> typing.Dict[typing.Hashable, float]:
+        return {key: dp.current_interval for key, dp in self.datapoints.items()}
+
+    def poll_rate(self) -> float:
+        """
+        :return: total number of polls per second
+        """
+        return sum(1 / dp.current_interval for dp in self.datapoints.values())
+
+
+class AdaptivePolicy(FixedPolicy):
+    """
+    Polls each datapoint often enough to see changes of about `resolution`
+    between polls, based on its recently observed rate of change: moving
+    values are polled faster, stable values slower, always within
+    [min_interval, max_interval].
+
+    When the resulting total exceeds `budget` polls per second, the
+    intervals are stretched until it fits.
+    """
+    def __init__(self, budget: float, smoothing: float = 0.3):
+        super().__init__()
+        self.budget = budget
+        self.smoothing = smoothing
+        self._over_budget_warned = False
+
+    def add(self, key, interval, min_interval=None, max_interval=None, resolution=1.0) -> None:
+        super().add(key, interval, min_interval, max_interval, resolution)
+        self.recompute()
+
+    def observe(self, key: typing.Hashable, value: float, timestamp: float = None) -> None:
+        try:
+            dp = self.datapoints[key]
+        except KeyError:
+            return  # not polled, e.g. Info from another device
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        if dp.last_time is not None and timestamp > dp.last_time:
+            rate = abs(value - dp.last_value) / (timestamp - dp.last_time)
+            if dp.rate is None:
+                dp.rate = rate
+            else:
+                dp.rate += self.smoothing * (rate - dp.rate)
+        dp.last_value = value
+        dp.last_time = timestamp
+
+        self.recompute()
+
+    @staticmethod
+    def desired_interval(dp: Datapoint) -> float:
+        if dp.rate is None:
+            interval = dp.interval  # no estimate yet
+        elif dp.rate <= 0:
+            interval = dp.max_interval
+        else:
+            interval = dp.resolution / dp.rate
+        return min(max(interval, dp.min_interval), dp.max_interval)
+
+    def recompute(self) -> None:
+        datapoints = list(self.datapoints.values())
+        intervals = [self.desired_interval(dp) for dp in datapoints]
+
+        # Stretch the intervals that are not yet at their maximum until the
+        # load fits the budget. Each pass either fits, or caps at least one
+        # more datapoint.
+        for _ in range(len(intervals)):
+            load = sum(1 / i for i in intervals)
+            if load <= self.budget * (1 + 1e-9):
+                break
+            capped_load = sum(1 / dp.max_interval for dp, i in zip(datapoints, intervals) if i >= dp.max_interval)
+            free_load = load - capped_load
+            if self.budget <= capped_load or free_load <= 0:
+                intervals = [dp.max_interval for dp in datapoints]
+                break
+            factor = free_load / (self.budget - capped_load)
+            intervals = [min(i * factor, dp.max_interval) for dp, i in zip(datapoints, intervals)]
+
+        over_budget = sum(1 / i for i in intervals) > self.budget * (1 + 1e-9)
+        if over_budget and not self._over_budget_warned:
+            logger.warning(f"Polling budget of {self.budget}/s is below what the maximum intervals allow")
+        self._over_budget_warned = over_budget
+
+        for dp, interval in zip(datapoints, intervals):
+            dp.current_interval = interval
@@ -0,0 +1,164 @@
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import time
+import typing
+
+
+logger = logging.getLogger(__name__)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ('stats', 'start')
+
+    def __init__(self, stats: "StageStats"):
+        self.stats = stats
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stats.add(time.perf_counter() - self.start)
+        return False
+
+
+class StageStats:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def __str__(self):
+        if self.count == 0:
+            return "0 calls"
+        return (f"{self.count} calls, total {self.total * 1e3:.1f}ms, "
+                f"mean {self.total / self.count * 1e6:.1f}us, max {self.max * 1e6:.1f}us")
+
+
+class StageTimers:
+    """
+    Accumulates the time spent in named stages:
+
+        with timers.time('decode'):
+            ...
+
+    When disabled, `time()` returns a shared no-op context manager, so the
+    instrumentation can stay in the hot path.
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stages = {}  # name -> StageStats
+        self.since = time.monotonic()
+
+    def time(self, stage: str):
+        if not self.enabled:
+            return _null_timer
+        return _StageTimer(self.get(stage))
+
+    def get(self, stage: str) -> StageStats:
+        try:
+            return self.stages[stage]
+        except KeyError:
+            stats = self.stages[stage] = StageStats()
+            return stats
+
+    def add(self, stage: str, duration: float) -> None:
+        if self.enabled:
+            self.get(stage).add(duration)
+
+    def report(self, reset: bool = True) -> str:
+        lines = [f"Stage timings over the last {time.monotonic() - self.since:.0f}s:"]
+        for name, stats in self.stages.items():
+            lines.append(f" - {name}: {stats}")
+        if reset:
+            self.stages = {}
+            self.since = time.monotonic()
+        return "\n".join(lines)
+
+
+async def measure_loop_lag(timers: StageTimers, interval: float = 0.1, stage: str = 'loop_lag'):
+    """
+    Records how late the event loop wakes up a task that sleeps `interval`.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        expected = loop.time() + interval
+        try:
+            await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            break
+        timers.add(stage, max(loop.time() - expected, 0.0))
+
+
+class Profiler:
+    """
+    Runs cProfile for a fixed duration, then dumps the statistics to the log
+    and, optionally, to a file loadable with `pstats`.
+    """
+    def __init__(
+            self,
+            duration: float,
+            output: typing.Optional[str] = None,
+            loop: asyncio.AbstractEventLoop = None,
+    ):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        self.duration = duration
+        self.output = output
+        self.profile = None
+        self._stop_handle = None
+
+    def start(self) -> None:
+        if self.profile is not None:
+            logger.info("Profiler already running")
+            return
+        logger.info(f"Profiling for {self.duration}s")
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self._stop_handle = self.loop.call_later(self.duration, self.stop)
+
+    def stop(self) -> None:
+        if self.profile is None:
+            return
+        profile, self.profile = self.profile, None  # allow a new run, whatever happens below
+        profile.disable()
+        if self._stop_handle is not None:
+            self._stop_handle.cancel()  # when stopped early, don't stop the next run
+            self._stop_handle = None
+
+        if self.output is not None:
+            filename = time.strftime(self.output, time.gmtime())
+            try:
+                profile.dump_stats(filename)
+                logger.info(f"Profile written to {filename}")
+            except OSError as e:
+                logger.warning(f"Could not write profile to {filename}: {e}")
+
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(25)
+        logger.info("Profile:\n%s", report.getvalue())
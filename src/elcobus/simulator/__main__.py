@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import logging
+import re
+import time
+
+from paho.mqtt import client as mqtt
+
+from .boiler import Boiler, BusConditions
+from .loadgen import LoadGenerator
+from .transport import InProcessBroker, MqttBus, PtyBus
+
+
+parser = argparse.ArgumentParser(description='Elcobus boiler simulator')
+parser.add_argument('--pty', help="Expose the bus on a pseudo-terminal instead of MQTT", action='store_true')
+parser.add_argument('--load-test', help="Run an in-process load test for the given number of seconds, "
+                                        "then print statistics", type=float)
+parser.add_argument('--request-rate', help="Get requests per second sent during --load-test",
+                    type=float, default=1000)
+parser.add_argument('--info-rate', help="Info frames per second sent by the boiler", type=float, default=0)
+parser.add_argument('--latency', help="Reply latency in seconds", type=float, default=0)
+parser.add_argument('--jitter', help="Additional random reply latency in seconds", type=float, default=0)
+parser.add_argument('--loss', help="Probability of losing a frame", type=float, default=0)
+parser.add_argument('--corruption', help="Probability of corrupting a frame", type=float, default=0)
+parser.add_argument('--seed', help="Random seed, for reproducible runs", type=int)
+parser.add_argument('--debug', help="Enable debug mode", action='store_true')
+parser.add_argument('mqtt_uri', help="mqtt://host/topic/prefix url to communicate on", nargs='?',
+                    default="mqtt://localhost/elcobus")
+
+args = parser.parse_args()
+
+logging.basicConfig(
+    level=logging.DEBUG if args.debug else logging.INFO,
+    format="%(asctime)sZ [%(name)s %(levelname)s] %(message)s",
+)
+logging.Formatter.converter = time.gmtime
+logger = logging.getLogger(__name__)
+
+mqtt_uri_match = re.fullmatch(r'mqtt://'
+                              r'((?P<username>[^:@]+)(:(?P<password>[^@]*)?@))?'
+                              r'(?P<host>[^/:]+)'
+                              r'(:(?P<port>\d+))?'
+                              r'(/(?P<topic>.*))?', args.mqtt_uri)
+if mqtt_uri_match is None:
+    parser.error(f"Could not parse MQTT URI `{args.mqtt_uri}`")
+mqtt_uri = mqtt_uri_match.groupdict()
+
+loop = asyncio.get_event_loop()
+
+boiler = Boiler(
+    loop,
+    conditions=BusConditions(
+        latency=args.latency, jitter=args.jitter,
+        loss=args.loss, corruption=args.corruption,
+    ),
+    seed=args.seed,
+)
+
+if args.load_test is not None:
+    broker = InProcessBroker(loop)
+    boiler_client = broker.client()
+    boiler.attach(MqttBus(boiler_client, mqtt_uri['topic']))
+    boiler_client.connect()
+    generator_client = broker.client()
+    generator = LoadGenerator(generator_client, mqtt_uri['topic'], args.request_rate, loop=loop)
+    generator_client.connect()
+    boiler.start_info(args.info_rate)
+
+    start = time.perf_counter()
+    loop.run_until_complete(generator.run(args.load_test))
+    loop.run_until_complete(asyncio.sleep(args.latency + args.jitter + 0.1))  # drain
+    duration = time.perf_counter() - start
+    boiler.stop_info()
+
+    print(generator.report(duration))
+    print("boiler: " + ", ".join(f"{key} {count}" for key, count in boiler.stats.items()))
+
+elif args.pty:
+    bus = PtyBus(loop)
+    boiler.attach(bus)
+    boiler.start_info(args.info_rate)
+    print(bus.device_name, flush=True)
+    loop.run_forever()
+
+else:
+    client = mqtt.Client()
+    if mqtt_uri['username'] is not None:
+        client.username_pw_set(username=mqtt_uri['username'], password=mqtt_uri['password'])
+    bus = MqttBus(client, mqtt_uri['topic'])
+    boiler.attach(bus)
+    # paho runs its own network thread; hand frames over to the event loop
+    receive = bus.receiver
+    bus.receiver = lambda frame: loop.call_soon_threadsafe(receive, frame)
+    boiler.start_info(args.info_rate)
+    client.connect(host=mqtt_uri['host'], port=int(mqtt_uri['port'] or 1883))
+    client.loop_start()
+    loop.run_forever()
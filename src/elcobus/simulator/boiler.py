@@ -0,0 +1,219 @@
+import asyncio
+import dataclasses
+import logging
+import random
+import typing
+
+from ..ElcobusMessage import ElcobusFrame
+
+
+logger = logging.getLogger(__name__)
+
+
+# (field, logical address) pairs, as polled by the daemon
+DATAPOINTS = [
+    (ElcobusFrame.Field.BoilerTemperature, 0x0d),
+    (ElcobusFrame.Field.BoilerSetTemperature, 0x0d),
+    (ElcobusFrame.Field.BoilerReturnTemperature, 0x11),
+    (ElcobusFrame.Field.OutdoorTemperature, 0x05),
+    (ElcobusFrame.Field.TapWaterTemperature, 0x31),
+    (ElcobusFrame.Field.TapWaterSetTemperature, 0x31),
+    (ElcobusFrame.Field.BurnerModulation, 0x11),
+    (ElcobusFrame.Field.PumpModulation, 0x05),
+    (ElcobusFrame.Field.Pressure, 0x11),
+    (ElcobusFrame.Field.Status, 0x09),
+    (ElcobusFrame.Field.HeatingCircuitTemperature, 0x21),
+    (ElcobusFrame.Field.HeatingCircuitTemperature, 0x22),
+    (ElcobusFrame.Field.HeatingCircuitSetTemperature, 0x21),
+    (ElcobusFrame.Field.HeatingCircuitSetTemperature, 0x22),
+]
+
+
+@dataclasses.dataclass()
+class BusConditions:
+    latency: float = 0.0  # seconds before a reply is put on the bus
+    jitter: float = 0.0  # additional uniformly distributed delay, in seconds
+    loss: float = 0.0  # probability that a transmitted frame is dropped
+    corruption: float = 0.0  # probability that a transmitted frame gets a bit flipped
+
+
+@dataclasses.dataclass()
+class ValueModel:
+    """
+    Random walk within [minimum, maximum], quantized to what the data type
+    can represent.
+    """
+    attribute: str
+    initial: float
+    step: float
+    minimum: float
+    maximum: float
+    quantum: float
+
+    def walk(self, value: float, rng: random.Random) -> float:
+        value += rng.uniform(-self.step, self.step)
+        value = min(max(value, self.minimum), self.maximum)
+        value = round(value / self.quantum) * self.quantum
+        if self.quantum >= 1:
+            value = int(value)
+        return value
+
+
+VALUE_MODELS = {
+    ElcobusFrame.Temperature: ValueModel('temperature', 45.0, 0.25, -20.0, 90.0, 1/64),
+    ElcobusFrame.RoomStatus: ValueModel('temperature', 20.0, 0.05, 5.0, 30.0, 1/64),
+    ElcobusFrame.Pressure: ValueModel('pressure', 1.5, 0.01, 0.5, 3.0, 0.1),
+    ElcobusFrame.Percent: ValueModel('percent', 50, 5, 0, 100, 1),
+    ElcobusFrame.Status: ValueModel('status', 0, 0, 0, 0, 1),
+}
+
+
+class Boiler:
+    """
+    Simulated boiler controller.
+
+    Answers every `Get` for a known `Field` with a `Ret`, and optionally
+    emits unsollicited `Info` frames. Values follow a random walk, so
+    consumers see them change over time.
+
+    Frames are exchanged as raw bytes through a transport (see
+    `.transport`), which is connected with `attach()`.
+    """
+    def __init__(
+            self,
+            loop: asyncio.AbstractEventLoop = None,
+            conditions: BusConditions = None,
+            address: int = 0x00,
+            seed: typing.Optional[int] = None,
+    ):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+
+        if conditions is None:
+            conditions = BusConditions()
+        self.conditions = conditions
+
+        self.address = address
+        self.rng = random.Random(seed)
+
+        self.values = {}  # (field, logical address) -> value
+        self.stats = {
+            'received': 0,
+            'invalid': 0,
+            'replied': 0,
+            'info': 0,
+            'lost': 0,
+            'corrupted': 0,
+        }
+
+        self._transmit = None
+        self._info_task = None
+
+    def attach(self, transport) -> None:
+        transport.receiver = self.receive
+        self._transmit = transport.transmit
+
+    def value(self, field: ElcobusFrame.Field, logical_address: int) -> float:
+        model = VALUE_MODELS[field.data_type]
+        key = (field, logical_address)
+        value = self.values.get(key, model.initial)
+        value = model.walk(value, self.rng)
+        self.values[key] = value
+        return value
+
+    def data(self, field: ElcobusFrame.Field, logical_address: int):
+        model = VALUE_MODELS[field.data_type]
+        return field.data_type(**{model.attribute: self.value(field, logical_address)})
+
+    def receive(self, frame: bytes) -> None:
+        self.stats['received'] += 1
+        try:
+            ebm = ElcobusFrame.ElcobusFrame.from_bytes(frame)
+        except (BufferError, ValueError) as e:
+            self.stats['invalid'] += 1
+            logger.debug("Ignoring invalid frame: %s", e)
+            return
+
+        if not isinstance(ebm, ElcobusFrame.ElcobusMessage):
+            return
+        if ebm.message_type != ElcobusFrame.ElcobusMessage.MessageType.Get:
+            return
+        if ebm.destination_address != self.address:
+            return
+        if not isinstance(ebm.field, ElcobusFrame.Field) or ebm.field.data_type not in VALUE_MODELS:
+            return
+
+        reply = ElcobusFrame.ElcobusMessage(
+            source_address=self.address, destination_address=ebm.source_address,
+            message_type=ElcobusFrame.ElcobusMessage.MessageType.Ret,
+            logical_source=ebm.logical_destination, logical_destination=ebm.logical_source,
+            field=ebm.field,
+            data=self.data(ebm.field, ebm.logical_destination),
+        )
+        self.stats['replied'] += 1
+        self.send(reply.to_bytes())
+
+    def info(self, field: ElcobusFrame.Field, logical_address: int) -> None:
+        ebm = ElcobusFrame.ElcobusMessage(
+            source_address=self.address, destination_address=0x7f,
+            message_type=ElcobusFrame.ElcobusMessage.MessageType.Info,
+            logical_source=logical_address, logical_destination=0x3d,
+            field=field,
+            data=self.data(field, logical_address),
+        )
+        self.stats['info'] += 1
+        self.send(ebm.to_bytes())
+
+    def send(self, frame: bytes) -> None:
+        """
+        Put `frame` on the bus, subject to `self.conditions`.
+        """
+        if self.conditions.loss and self.rng.random() < self.conditions.loss:
+            self.stats['lost'] += 1
+            return
+
+        if self.conditions.corruption and self.rng.random() < self.conditions.corruption:
+            self.stats['corrupted'] += 1
+            frame = bytearray(frame)
+            frame[self.rng.randrange(len(frame))] ^= 1 << self.rng.randrange(8)
+
+        delay = self.conditions.latency
+        if self.conditions.jitter:
+            delay += self.rng.uniform(0, self.conditions.jitter)
+
+        if delay > 0:
+            self.loop.call_later(delay, self._transmit, bytes(frame))
+        else:
+            self._transmit(bytes(frame))
+
+    def start_info(self, rate: float, datapoints: typing.Sequence = DATAPOINTS) -> None:
+        """
+        Emit `rate` Info frames per second for randomly chosen `datapoints`.
+        """
+        self.stop_info()
+        if rate > 0:
+            self._info_task = self.loop.create_task(self._info_loop(rate, datapoints))
+
+    def stop_info(self) -> None:
+        if self._info_task is not None:
+            self._info_task.cancel()
+            self._info_task = None
+
+    async def _info_loop(self, rate: float, datapoints: typing.Sequence):
+        # Sleeping for every single frame doesn't keep up at thousands of
+        # frames per second; send whatever is due every tick instead.
+        tick = max(1/rate, 0.01)
+        due = 0.0
+        last = self.loop.time()
+        while True:
+            try:
+                await asyncio.sleep(tick)
+            except asyncio.CancelledError:
+                break
+            now = self.loop.time()
+            due += (now - last) * rate
+            last = now
+            while due >= 1:
+                due -= 1
+                self.info(*self.rng.choice(datapoints))
@@ -0,0 +1,101 @@
+import asyncio
+import collections
+import logging
+import time
+import typing
+
+from paho.mqtt import client as mqtt
+
+from ..ElcobusMessage import ElcobusFrame
+from .boiler import DATAPOINTS
+
+
+logger = logging.getLogger(__name__)
+
+
+class LoadGenerator:
+    """
+    Sends `Get` requests on `<topic>/bus_tx` at a fixed rate, and decodes
+    everything that arrives on `<topic>/bus_rx`. This measures the simulator,
+    transport and codec only; to include the daemon's receive path and poll
+    scheduling, connect an `elcobus.daemon.Daemon` instead.
+    """
+    def __init__(
+            self,
+            client,
+            topic: str,
+            rate: float,
+            datapoints: typing.Sequence = DATAPOINTS,
+            source_address: int = 0x01,
+            loop: asyncio.AbstractEventLoop = None,
+    ):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+
+        self.client = client
+        self.topic = topic
+        self.rate = rate
+
+        self.requests = [
+            ElcobusFrame.ElcobusMessage(
+                source_address=source_address, destination_address=0x00,
+                message_type=ElcobusFrame.ElcobusMessage.MessageType.Get,
+                logical_source=0x3d, logical_destination=logical_address,
+                field=field,
+            ).to_bytes()
+            for field, logical_address in datapoints
+        ]
+
+        self.stats = collections.Counter()
+        self.decode_time = 0.0
+
+        client.on_connect = self.on_connect
+        client.on_message = self.on_message
+
+    def on_connect(self, client, user_data, flags, rc):
+        client.subscribe(self.topic + '/bus_rx', 0)
+
+    def on_message(self, client, user_data, msg: mqtt.MQTTMessage):
+        self.stats['received'] += 1
+        start = time.perf_counter()
+        try:
+            ebm = ElcobusFrame.ElcobusFrame.from_bytes(msg.payload)
+        except (BufferError, ValueError):
+            self.stats['invalid'] += 1
+            return
+        finally:
+            self.decode_time += time.perf_counter() - start
+
+        if isinstance(ebm, ElcobusFrame.ElcobusMessage):
+            self.stats[ebm.message_type.name] += 1
+        else:
+            self.stats['unknown'] += 1
+
+    async def run(self, duration: float) -> None:
+        tick = max(1/self.rate, 0.01)
+        due = 0.0
+        i = 0
+        start = last = self.loop.time()
+        while last - start < duration:
+            await asyncio.sleep(tick)
+            now = self.loop.time()
+            due += (now - last) * self.rate
+            last = now
+            while due >= 1:
+                due -= 1
+                self.client.publish(self.topic + '/bus_tx', self.requests[i], qos=0)
+                self.stats['sent'] += 1
+                i = (i + 1) % len(self.requests)
+
+    def report(self, duration: float) -> str:
+        received = self.stats['received']
+        lines = [
+            f"sent {self.stats['sent']} requests, received {received} frames "
+            f"in {duration:.1f}s ({received / duration:.0f} frames/s)",
+        ]
+        if received:
+            lines.append(f"decode: {self.decode_time / received * 1e6:.1f}us/frame")
+        for key, count in sorted(self.stats.items()):
+            lines.append(f" - {key}: {count}")
+        return "\n".join(lines)
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import tty
+import typing
+
+from paho.mqtt import client as mqtt
+
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessBroker:
+    """
+    Minimal in-process stand-in for an MQTT broker.
+
+    Supports wildcard subscriptions and retained messages. QoS is accepted
+    but ignored: every message is delivered exactly once, in order.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop = None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+
+        self.clients = []
+        self.retained = {}  # topic -> MQTTMessage
+
+    def client(self, *args, **kwargs) -> "InProcessClient":
+        """
+        Create a new client. Accepts (and ignores) the arguments of
+        `paho.mqtt.client.Client`, so it can be used as a drop-in factory.
+        """
+        return InProcessClient(self)
+
+    def publish(self, topic: str, payload, qos: int = 0, retain: bool = False) -> None:
+        msg = mqtt.MQTTMessage(topic=topic.encode('utf-8'))
+        msg.payload = _to_bytes(payload)
+        msg.qos = qos
+
+        if retain:
+            if len(msg.payload) == 0:
+                self.retained.pop(topic, None)
+            else:
+                self.retained[topic] = msg
+
+        for client in self.clients:
+            if client.is_subscribed(topic):
+                self.loop.call_soon(client.deliver, msg)
+
+
+def _to_bytes(payload) -> bytes:
+    # Same conversions as paho does
+    if payload is None:
+        return b''
+    if isinstance(payload, str):
+        return payload.encode('utf-8')
+    if isinstance(payload, (int, float)):
+        return str(payload).encode('ascii')
+    return bytes(payload)
+
+
+class InProcessClient:
+    """
+    Implements the subset of `paho.mqtt.client.Client` used by the daemon,
+    connected to an `InProcessBroker`.
+    """
+    def __init__(self, broker: InProcessBroker):
+        self.broker = broker
+        self.subscriptions = set()
+        self.will = None
+        self._connected = False
+
+        self.on_connect = None
+        self.on_message = None
+        self.on_disconnect = None
+
+    def username_pw_set(self, username, password=None) -> None:
+        pass
+
+    def will_set(self, topic: str, payload=None, qos: int = 0, retain: bool = False) -> None:
+        self.will = (topic, payload, qos, retain)
+
+    def connect(self, host: str = None, port: int = 1883, keepalive: int = 60) -> int:
+        self._connected = True
+        self.broker.clients.append(self)
+        if self.on_connect is not None:
+            self.broker.loop.call_soon(self.on_connect, self, None, {}, 0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def disconnect(self) -> int:
+        if not self._connected:
+            return mqtt.MQTT_ERR_NO_CONN
+        self._connected = False
+        self.broker.clients.remove(self)
+        self.subscriptions.clear()
+        if self.on_disconnect is not None:
+            self.broker.loop.call_soon(self.on_disconnect, self, None, 0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def loop_misc(self) -> int:
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def subscribe(self, topic: str, qos: int = 0) -> typing.Tuple[int, int]:
+        self.subscriptions.add(topic)
+        for retained_topic, msg in self.broker.retained.items():
+            if mqtt.topic_matches_sub(topic, retained_topic):
+                retained = mqtt.MQTTMessage(topic=msg.topic.encode('utf-8'))
+                retained.payload = msg.payload
+                retained.qos = msg.qos
+                retained.retain = True
+                self.broker.loop.call_soon(self.deliver, retained)
+        return mqtt.MQTT_ERR_SUCCESS, 0
+
+    def unsubscribe(self, topic: str) -> typing.Tuple[int, int]:
+        self.subscriptions.discard(topic)
+        return mqtt.MQTT_ERR_SUCCESS, 0
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False) -> None:
+        if not self._connected:
+            return
+        self.broker.publish(topic, payload, qos, retain)
+
+    def is_subscribed(self, topic: str) -> bool:
+        return any(mqtt.topic_matches_sub(sub, topic) for sub in self.subscriptions)
+
+    def deliver(self, msg: mqtt.MQTTMessage) -> None:
+        if self._connected and self.on_message is not None:
+            self.on_message(self, None, msg)
+
+
+class MqttBus:
+    """
+    Plays the role of the bus gateway: frames published by the daemon on
+    `<topic>/bus_tx` are handed to `receiver`, frames passed to `transmit()`
+    are published on `<topic>/bus_rx`.
+
+    Works with both a real `paho.mqtt.client.Client` and an `InProcessClient`.
+    """
+    def __init__(self, client, topic: str, qos: int = 0):
+        self.client = client
+        self.topic = topic
+        self.qos = qos
+        self.receiver = None
+
+        client.on_connect = self.on_connect
+        client.on_message = self.on_message
+
+    def on_connect(self, client, user_data, flags, rc):
+        client.subscribe(self.topic + '/bus_tx', self.qos)
+
+    def on_message(self, client, user_data, msg: mqtt.MQTTMessage):
+        if self.receiver is not None:
+            self.receiver(msg.payload)
+
+    def transmit(self, frame: bytes) -> None:
+        self.client.publish(self.topic + '/bus_rx', frame, qos=self.qos)
+
+
+class PtyBus:
+    """
+    Exposes the simulated bus as a pseudo-terminal, for gateways that talk to
+    a serial device. Point them at `device_name`.
+
+    Incoming bytes are split into frames on start-of-frame and length byte;
+    validating the CRC is left to the receiver.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop = None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        self.receiver = None
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.device_name = os.ttyname(self.slave)
+        os.set_blocking(self.master, False)
+
+        self._buffer = bytearray()
+        self.loop.add_reader(self.master, self._on_readable)
+        logger.info("Simulated bus available on %s", self.device_name)
+
+    def close(self) -> None:
+        self.loop.remove_reader(self.master)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _on_readable(self) -> None:
+        try:
+            self._buffer += os.read(self.master, 4096)
+        except (BlockingIOError, OSError):
+            return
+
+        while len(self._buffer) >= 4:
+            if self._buffer[0] & 0xfc != 0xdc:  # start of frame, ignoring the _unkn1 bit
+                del self._buffer[0]  # resync
+                continue
+            dlen = self._buffer[3]
+            if not 6 <= dlen <= 32:
+                del self._buffer[0]  # resync
+                continue
+            if len(self._buffer) < dlen:
+                break
+            frame = bytes(self._buffer[0:dlen])
+            del self._buffer[0:dlen]
+            if self.receiver is not None:
+                self.receiver(frame)
+
+    def transmit(self, frame: bytes) -> None:
+        os.write(self.master, frame)
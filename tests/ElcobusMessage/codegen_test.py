@@ -0,0 +1,94 @@
+import enum
+
+import pytest
+from elcobus.ElcobusMessage import _codegen, ElcobusFrame as ElcobusFrameModule
+from elcobus.ElcobusMessage.ElcobusFrame import ElcobusFrame, Pressure
+
+
+types = _codegen.make_payload_types("""
+Temperature  flag:u8=0  temperature:s16/64
+RoomStatus   temperature:s16/64  _unkn1:u8=0  # trailing constant
+Percent      flag:u8=0  percent:u8
+""")
+Temperature = types['Temperature']
+RoomStatus = types['RoomStatus']
+Percent = types['Percent']
+
+
+def test_decode():
+    t = Temperature.from_bytes(b'\x00\x0d\xf6')
+    assert t.temperature == 55.84375
+    assert t.flag == Temperature.Zero.Zero
+    assert t == Temperature(temperature=55.84375)
+
+
+def test_encode():
+    assert Temperature(temperature=55.84375).to_bytes() == b'\x00\x0d\xf6'
+    assert Temperature(temperature=-1).to_bytes() == b'\x00\xff\xc0'
+
+
+def test_len():
+    assert len(Temperature()) == 3
+    assert len(Percent(percent=5)) == 2
+
+
+def test_frame_round_trip():
+    d = b'\xdc\x80\x01\x0e\x07\x11\x3d\x30\x63\x00\x00\x0a\x85\x32'
+    f = ElcobusFrame.from_bytes(d)
+    assert isinstance(f.data, Pressure)
+    assert f.to_bytes() == d
+
+
+def test_payload_types_exported():
+    for name, data_type in ElcobusFrameModule.payload_types.items():
+        assert getattr(ElcobusFrameModule, name) is data_type
+
+
+def test_private_attribute():
+    r = RoomStatus.from_bytes(b'\x05\x78\x00')
+    assert r.temperature == 21.875
+    assert r.to_bytes() == b'\x05\x78\x00'
+
+
+def test_const_mismatch():
+    with pytest.raises(ValueError):
+        Percent.from_bytes(b'\x01\x10')
+
+
+def test_wrong_length():
+    with pytest.raises(ValueError):
+        Percent.from_bytes(b'\x00\x10\x00')
+
+
+def test_fields():
+    class FieldBase(int, enum.Enum):
+        def __new__(cls, value, data_type, options):
+            o = int.__new__(cls, value)
+            o._value_ = value
+            o.data_type = data_type
+            return o
+
+    Field = FieldBase('Field', _codegen.parse_fields("""
+        0x0519  BoilerTemperature  Temperature
+        0x305f  BurnerModulation   Percent  # comment
+        0x0518  HeatingCircuitTemperature  Temperature  circuits=2
+    """, types))
+    assert Field(0x305f) is Field.BurnerModulation
+    assert Field.BoilerTemperature.data_type is Temperature
+    assert Field.HeatingCircuitTemperature.value == 0x0518
+
+
+def test_metadata():
+    t = _codegen.make_payload_types("Temperature  flag:u8=0  temperature:s16/64  unit=°C  class=temperature")
+    assert t['Temperature'].unit == '°C'
+    assert t['Temperature'].device_class == 'temperature'
+    assert t['Temperature'].value_attribute == 'temperature'
+    assert Percent.unit is None
+    assert RoomStatus.value_attribute == 'temperature'
+
+
+def test_invalid_schema():
+    with pytest.raises(ValueError):
+        _codegen.make_payload_types("Broken  flag:u7")
+    with pytest.raises(ValueError):
+        _codegen.make_payload_types("Broken  flag:u8  colour=blue")
@@ -0,0 +1,20 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def settle(loop):
+    """
+    Run the loop for a moment, so pending callbacks get processed.
+    """
+    def settle(delay: float = 0.01):
+        loop.run_until_complete(asyncio.sleep(delay))
+    return settle
@@ -0,0 +1,102 @@
+import json
+
+from elcobus.ElcobusMessage.ElcobusFrame import ElcobusMessage, Field, Temperature
+from elcobus.daemon import Daemon, MqttConnectionDetails
+from elcobus.framestore import FrameStore
+from elcobus.polling import AdaptivePolicy
+from elcobus.simulator.boiler import Boiler, DATAPOINTS
+from elcobus.simulator.transport import InProcessBroker, MqttBus
+
+
+def get(field, logical_destination):
+    return ElcobusMessage(
+        source_address=0x01, destination_address=0x00,
+        message_type=ElcobusMessage.MessageType.Get,
+        logical_source=0x3d, logical_destination=logical_destination,
+        field=field,
+    )
+
+
+def make_daemon(loop, broker, **kwargs):
+    boiler_client = broker.client()
+    boiler = Boiler(loop, seed=1)
+    boiler.attach(MqttBus(boiler_client, 'bus'))
+    boiler_client.connect()
+
+    daemon = Daemon(MqttConnectionDetails.from_uri('mqtt://localhost/bus'), 'elcobus',
+                    loop=loop, client_factory=broker.client, **kwargs)
+    return boiler, daemon
+
+
+def test_simulated_boiler(loop, settle):
+    broker = InProcessBroker(loop)
+    frame_store = FrameStore(100000)
+    boiler, daemon = make_daemon(loop, broker, poll_policy=AdaptivePolicy(budget=10000), frame_store=frame_store)
+
+    tasks = [loop.create_task(daemon.main())]
+    tasks += [
+        loop.create_task(daemon.poll_every(0.02, get(field, logical_address), min_interval=0.01, max_interval=0.05))
+        for field, logical_address in DATAPOINTS
+    ]
+    boiler.start_info(500)
+    settle(0.3)
+    boiler.stop_info()
+    for task in tasks:
+        task.cancel()
+    settle()
+
+    assert boiler.stats['replied'] > len(DATAPOINTS)
+    assert boiler.stats['info'] > 0
+    # Every frame on bus_rx made it through the receive path
+    assert len(frame_store) == boiler.stats['replied'] + boiler.stats['info']
+
+    assert broker.retained['elcobus/status'].payload == b'online'
+    assert 0.5 <= float(broker.retained['elcobus/Pressure'].payload) <= 3.0
+    assert 'elcobus/HeatingCircuitTemperature 2' in broker.retained
+    assert 'elcobus/metrics/poll_interval/Pressure' in broker.retained
+    # Replies are fed back to the poll policy
+    assert all(dp.last_value is not None for dp in daemon.poll_policy.datapoints.values())
+
+
+def test_history_query(loop, settle):
+    broker = InProcessBroker(loop)
+    boiler, daemon = make_daemon(loop, broker, frame_store=FrameStore(10))
+    main = loop.create_task(daemon.main())
+    settle()
+
+    results = []
+    client = broker.client()
+    client.on_message = lambda client, user_data, msg: results.append(json.loads(msg.payload))
+    client.connect()
+    client.subscribe('elcobus/history/result')
+
+    boiler.info(*DATAPOINTS[0])
+    settle()
+    client.publish('elcobus/history/query', json.dumps({'query': 'between', 'id': 1}))
+    settle()
+    main.cancel()
+    settle()
+
+    assert results[0]['id'] == 1
+    assert len(results[0]['frames']) == 1
+
+
+def test_circuit_out_of_range(loop, settle):
+    broker = InProcessBroker(loop)
+    boiler, daemon = make_daemon(loop, broker)
+    main = loop.create_task(daemon.main())
+    settle()
+
+    for logical_source in (0x21, 0x23, 0x2d):
+        daemon.process_frame(ElcobusMessage(
+            source_address=0x00, destination_address=0x7f,
+            message_type=ElcobusMessage.MessageType.Info,
+            logical_source=logical_source, logical_destination=0x3d,
+            field=Field.HeatingCircuitTemperature,
+            data=Temperature(temperature=21.5),
+        ))
+    main.cancel()
+    settle()
+
+    assert [topic for topic in broker.retained if topic.startswith('elcobus/HeatingCircuit')] \
+        == ['elcobus/HeatingCircuitTemperature 1']
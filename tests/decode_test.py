@@ -0,0 +1,117 @@
+import json
+import os
+import select
+import subprocess
+import sys
+
+import decode
+from elcobus.ElcobusMessage.ElcobusFrame import Field
+
+
+RET = b'\xdc\x80\x01\x0e\x07\x11\x3d\x30\x63\x00\x00\x0a\x85\x32'
+INFO = b'\xdc\x86\x00\x0e\x02\x3d\x2d\x02\x15\x05\x78\x00\x93\xef'
+
+
+def hexdump(frame):
+    return ' '.join(f"{b:02x}" for b in frame).encode('ascii')
+
+
+def chunks(*parts):
+    parts = list(parts)
+    return lambda size: parts.pop(0) if parts else b''
+
+
+def test_header_filter():
+    assert not decode.HeaderFilter()
+    assert decode.HeaderFilter(sources=[0x00])(RET)
+    assert not decode.HeaderFilter(sources=[0x06])(RET)
+    assert decode.HeaderFilter(destinations=[0x01])(RET)
+    assert not decode.HeaderFilter(destinations=[0x00])(RET)
+    assert decode.HeaderFilter(message_types=[7])(RET)
+    assert not decode.HeaderFilter(message_types=[2])(RET)
+    assert decode.HeaderFilter(fields=[Field.Pressure.value])(RET)
+    assert not decode.HeaderFilter(fields=[Field.Pressure.value])(INFO)
+    assert decode.HeaderFilter(sources=[0x06], message_types=[2], fields=[0x0215])(INFO)
+    assert not decode.HeaderFilter(sources=[0x06])(INFO[0:8])
+
+
+def test_split_line():
+    blocks = list(decode.read_until_eof(chunks(b'first\nsec', b'ond\nthi', b'rd\n')))
+    assert b''.join(blocks) == b'first\nsecond\nthird\n'
+    assert all(block.endswith(b'\n') for block in blocks if block)
+
+
+def test_idle_after_short_read():
+    full = b'x' * (decode.BLOCK_SIZE - 1) + b'\n'
+    blocks = list(decode.read_until_eof(chunks(full, b'short\n')))
+    assert blocks == [full, b'short\n', b'']  # empty block: flush
+
+
+def test_unterminated_last_line():
+    blocks = list(decode.read_until_eof(chunks(b'first\nlast')))
+    assert blocks == [b'first\n', b'', b'last']
+
+
+def test_text():
+    line = b'12:00Z Rx: EBM: [' + hexdump(RET) + b'] end\n'
+    out = decode.process_block(line, decode.HeaderFilter(), decode.Formatter('text', decode.DEFAULT_COLUMNS))
+    assert out.startswith(b'12:00Z Rx: EBM: ElcobusMessage(')
+    assert out.endswith(b') end\n')
+
+
+def test_jsonl():
+    block = b'a EBM: [' + hexdump(RET) + b']\nno frame here\nb EBM: [' + hexdump(INFO) + b']\n'
+    formatter = decode.Formatter('jsonl', ['prefix', 'type', 'field', 'value'])
+    rows = [json.loads(line) for line in decode.process_block(block, decode.HeaderFilter(), formatter).splitlines()]
+    assert rows == [
+        {'prefix': 'a ', 'type': 'Ret', 'field': 'Pressure', 'value': 1.0},
+        {'prefix': 'b ', 'type': 'Info', 'field': 'RoomStatus', 'value': 21.875},
+    ]
+
+
+def test_csv_header_once():
+    formatter = decode.Formatter('csv', ['field', 'value'])
+    block = b'EBM: [' + hexdump(RET) + b']\n'
+    first = decode.process_block(block, decode.HeaderFilter(), formatter)
+    second = decode.process_block(block, decode.HeaderFilter(), formatter)
+    assert first == b'field,value\nPressure,1.0\n'
+    assert second == b'Pressure,1.0\n'
+
+
+def test_follow_rotation(tmp_path):
+    path = str(tmp_path / 'elcobus.log')
+    with open(path, 'wb') as f:
+        f.write(b'first\nunterminated')
+
+    blocks = decode.follow(path)
+    try:
+        assert next(blocks) == b'first\n'
+        assert next(blocks) == b''  # idle
+
+        os.rename(path, path + '.1')
+        with open(path, 'wb') as f:
+            f.write(b'rotated\n')
+
+        assert next(blocks) == b'unterminated'
+        assert next(blocks) == b'rotated\n'
+    finally:
+        blocks.close()
+
+
+def test_stdin_not_held_back():
+    # e.g. `tail -f elcobus.log | decode.py`: output a line as soon as it arrives
+    proc = subprocess.Popen(
+        [sys.executable, decode.__file__],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+    )
+    try:
+        proc.stdin.write(b'EBM: [' + hexdump(RET) + b']\n')
+        proc.stdin.flush()
+        ready, _, _ = select.select([proc.stdout], [], [], 10)
+        assert ready
+        assert proc.stdout.readline().startswith(b'EBM: ElcobusMessage(')
+    finally:
+        proc.stdin.close()
+        proc.wait(timeout=10)
+        proc.stdout.close()
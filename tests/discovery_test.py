@@ -0,0 +1,49 @@
+import json
+
+from elcobus.ElcobusMessage.ElcobusFrame import Field
+from elcobus.discovery import Discovery, state_topic
+
+
+class Recorder:
+    def __init__(self):
+        self.messages = {}
+
+    def __call__(self, topic, payload, qos=0, retain=False):
+        assert retain
+        self.messages[topic] = json.loads(payload)
+
+
+def test_state_topic():
+    assert state_topic('elcobus', Field.Pressure) == 'elcobus/Pressure'
+    assert state_topic('elcobus', Field.HeatingCircuitTemperature, 1) == 'elcobus/HeatingCircuitTemperature 1'
+
+
+def test_initial(loop, settle):
+    publish = Recorder()
+    d = Discovery(publish, 'elcobus', loop=loop)
+    d.on_connect()
+    settle()
+
+    config = publish.messages['homeassistant/sensor/elcobus/Pressure/config']
+    assert config['state_topic'] == 'elcobus/Pressure'
+    assert config['unit_of_measurement'] == 'bar'
+    assert config['device_class'] == 'pressure'
+
+    config = publish.messages['homeassistant/sensor/elcobus/HeatingCircuitTemperature_2/config']
+    assert config['state_topic'] == 'elcobus/HeatingCircuitTemperature 2'
+
+
+def test_republish_on_reconnect(loop, settle):
+    publish = Recorder()
+    d = Discovery(publish, 'elcobus', min_interval=0.05, loop=loop)
+    d.on_connect()
+    settle()
+    published = dict(publish.messages)
+
+    publish.messages.clear()
+    d.on_connect()
+    settle()
+    assert publish.messages == {}  # rate limited
+
+    settle(0.05)
+    assert publish.messages == published
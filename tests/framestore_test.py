@@ -0,0 +1,118 @@
+import pytest
+from elcobus.ElcobusMessage.ElcobusFrame import ElcobusMessage, Field
+from elcobus.framestore import FrameStore, json_query
+
+
+RET = b'\xdc\x80\x01\x0e\x07\x11\x3d\x30\x63\x00\x00\x0a\x85\x32'
+INFO = b'\xdc\x86\x00\x0e\x02\x3d\x2d\x02\x15\x05\x78\x00\x93\xef'
+
+
+def get_frame():
+    return ElcobusMessage(
+        source_address=0x01, destination_address=0x00,
+        message_type=ElcobusMessage.MessageType.Get,
+        logical_source=0x3d, logical_destination=0x11,
+        field=Field.Pressure,
+    ).to_bytes()
+
+
+def test_append():
+    s = FrameStore(4)
+    seq = s.append(RET, timestamp=10.0)
+    assert len(s) == 1
+    assert s.raw(seq) == RET
+    assert s.timestamp(seq) == 10.0
+    assert s.frame(seq).data.pressure == 1.0
+
+
+def test_ring():
+    s = FrameStore(2)
+    for t in range(5):
+        s.append(INFO, timestamp=t)
+    assert len(s) == 2
+    assert list(s.between()) == [3, 4]
+    with pytest.raises(IndexError):
+        s.raw(2)
+
+
+def test_clock_stepped_back():
+    s = FrameStore(10)
+    s.append(INFO, timestamp=10.0)
+    back = s.append(INFO, timestamp=5.0)
+    later = s.append(INFO, timestamp=11.0)
+    assert s.timestamp(back) == 10.0
+    assert list(s.between(10.0, 11.0)) == [0, back]
+    assert list(s.between(11.0)) == [later]
+
+
+def test_last():
+    s = FrameStore(10)
+    s.append(RET, timestamp=1.0)
+    s.append(INFO, timestamp=2.0)
+    seq = s.append(RET, timestamp=3.0)
+    assert s.last(Field.Pressure) == seq
+    assert s.last(Field.Pressure, logical_source=0x11) == seq
+    assert s.last(Field.Pressure, logical_source=0x21) is None
+    assert s.last(Field.Status) is None
+
+
+def test_last_overwritten():
+    s = FrameStore(2)
+    s.append(RET, timestamp=1.0)
+    s.append(INFO, timestamp=2.0)
+    s.append(INFO, timestamp=3.0)
+    assert s.last(Field.Pressure) is None
+
+
+def test_between():
+    s = FrameStore(10)
+    for t in range(10):
+        s.append(INFO, timestamp=t)
+    assert list(s.between(3, 6)) == [3, 4, 5]
+    assert list(s.between(8.5)) == [9]
+    assert list(s.between(20, 30)) == []
+
+
+def test_pairs():
+    s = FrameStore(10)
+    get = s.append(get_frame(), timestamp=1.0)
+    s.append(INFO, timestamp=1.5)
+    ret = s.append(RET, timestamp=2.0)
+    assert list(s.pairs()) == [(get, ret)]
+
+
+def test_json_query():
+    s = FrameStore(10)
+    s.append(RET, timestamp=1.0)
+    result = json_query(s, {'id': 7, 'query': 'last', 'field': 'Pressure'})
+    assert result['id'] == 7
+    assert result['frames'][0]['raw'] == RET.hex()
+
+    assert 'error' in json_query(s, {'query': 'bogus'})
+
+
+def test_json_query_between_pages():
+    s = FrameStore(100)
+    for t in range(30):
+        s.append(INFO, timestamp=t)
+
+    result = json_query(s, {'query': 'between'})
+    assert len(result['frames']) == 20
+    assert result['next'] == 20
+
+    result = json_query(s, {'query': 'between', 'from': 5, 'limit': 10, 'start': 20})
+    assert [f['seq'] for f in result['frames']] == list(range(20, 30))
+    assert 'next' not in result
+
+
+def test_json_query_pairs_pages():
+    s = FrameStore(100)
+    for t in range(5):
+        s.append(get_frame(), timestamp=2 * t)
+        s.append(RET, timestamp=2 * t + 1)
+
+    result = json_query(s, {'query': 'pairs', 'limit': 2})
+    assert [p['reply']['seq'] for p in result['pairs']] == [1, 3]
+    result = json_query(s, {'query': 'pairs', 'limit': 2, 'start': result['next']})
+    assert [p['request']['seq'] for p in result['pairs']] == [4, 6]
+    assert result['next'] == 9
@@ -0,0 +1,67 @@
+import pytest
+from elcobus.polling import AdaptivePolicy, FixedPolicy
+
+
+def test_fixed():
+    p = FixedPolicy()
+    p.add('a', 60)
+    p.observe('a', 10, 0)
+    p.observe('a', 50, 1)
+    assert p.interval('a') == 60
+    assert p.poll_rate() == pytest.approx(1/60)
+
+
+def test_initial_interval():
+    p = AdaptivePolicy(budget=10)
+    p.add('a', 60, min_interval=10, max_interval=300)
+    assert p.interval('a') == 60
+
+
+def test_moving_value_polled_faster():
+    p = AdaptivePolicy(budget=10)
+    p.add('a', 60, min_interval=10, max_interval=300, resolution=0.5)
+    p.observe('a', 40.0, 0)
+    p.observe('a', 45.0, 60)  # 1/12 per second: 0.5 change every 6s
+    assert p.interval('a') == 10
+
+
+def test_stable_value_polled_slower():
+    p = AdaptivePolicy(budget=10)
+    p.add('a', 60, min_interval=10, max_interval=300, resolution=0.5)
+    p.observe('a', 40.0, 0)
+    p.observe('a', 40.0, 60)
+    assert p.interval('a') == 300
+
+
+def test_bounds_interpolate():
+    p = AdaptivePolicy(budget=10)
+    p.add('a', 60, min_interval=10, max_interval=300, resolution=0.5)
+    p.observe('a', 40.0, 0)
+    p.observe('a', 40.5, 100)
+    assert p.interval('a') == pytest.approx(100)
+
+
+def test_budget():
+    p = AdaptivePolicy(budget=0.1)
+    for key in 'abc':
+        p.add(key, 60, min_interval=10, max_interval=300)
+        p.observe(key, 0, 0)
+        p.observe(key, 100, 10)
+    assert p.poll_rate() == pytest.approx(0.1)
+    assert p.interval('a') == pytest.approx(30)
+
+
+def test_budget_respects_max():
+    p = AdaptivePolicy(budget=0.1)
+    p.add('slow', 60, min_interval=10, max_interval=20)
+    p.add('fast', 60, min_interval=10, max_interval=300)
+    for key in ('slow', 'fast'):
+        p.observe(key, 0, 0)
+        p.observe(key, 100, 10)
+    assert p.interval('slow') == 20
+    assert p.interval('fast') == pytest.approx(1 / (0.1 - 1/20))
+
+
+def test_unknown_key_ignored():
+    p = AdaptivePolicy(budget=1)
+    p.observe('unknown', 1.0, 0)
@@ -0,0 +1,52 @@
+import asyncio
+
+from elcobus.profiling import Profiler, StageTimers, measure_loop_lag
+
+
+def test_disabled():
+    timers = StageTimers(enabled=False)
+    with timers.time('decode'):
+        pass
+    timers.add('decode', 1.0)
+    assert timers.stages == {}
+
+
+def test_time():
+    timers = StageTimers(enabled=True)
+    for _ in range(3):
+        with timers.time('decode'):
+            pass
+    timers.add('publish', 0.5)
+    assert timers.stages['decode'].count == 3
+    assert timers.stages['publish'].total == 0.5
+    assert timers.stages['publish'].max == 0.5
+
+
+def test_report_resets():
+    timers = StageTimers(enabled=True)
+    timers.add('decode', 0.001)
+    report = timers.report()
+    assert 'decode: 1 calls' in report
+    assert timers.stages == {}
+
+
+def test_loop_lag():
+    timers = StageTimers(enabled=True)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(measure_loop_lag(timers, interval=0.01))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    task.cancel()
+    loop.run_until_complete(task)
+    loop.close()
+    assert timers.stages['loop_lag'].count > 0
+
+
+def test_profiler_unwritable_output(loop, tmp_path):
+    profiler = Profiler(10, str(tmp_path / 'missing' / 'elcobus.prof'), loop)
+    profiler.start()
+    profiler.stop()
+    assert profiler.profile is None
+
+    profiler.start()
+    assert profiler.profile is not None
+    profiler.stop()
@@ -0,0 +1,59 @@
+import pytest
+from elcobus.ElcobusMessage.ElcobusFrame import ElcobusFrame, ElcobusMessage, Field
+from elcobus.simulator.boiler import Boiler, BusConditions
+
+
+class Recorder:
+    def __init__(self):
+        self.receiver = None
+        self.frames = []
+
+    def transmit(self, frame):
+        self.frames.append(frame)
+
+
+def get(field, logical_destination):
+    return ElcobusMessage(
+        source_address=0x01, destination_address=0x00,
+        message_type=ElcobusMessage.MessageType.Get,
+        logical_source=0x3d, logical_destination=logical_destination,
+        field=field,
+    ).to_bytes()
+
+
+def test_get_ret(loop):
+    bus = Recorder()
+    boiler = Boiler(loop, seed=1)
+    boiler.attach(bus)
+
+    bus.receiver(get(Field.Pressure, 0x11))
+
+    assert len(bus.frames) == 1
+    f = ElcobusFrame.from_bytes(bus.frames[0])
+    assert f.message_type == ElcobusMessage.MessageType.Ret
+    assert f.destination_address == 0x01
+    assert f.logical_source == 0x11
+    assert f.field == Field.Pressure
+    assert 0.5 <= f.data.pressure <= 3.0
+
+
+def test_loss(loop):
+    bus = Recorder()
+    boiler = Boiler(loop, conditions=BusConditions(loss=1.0))
+    boiler.attach(bus)
+
+    bus.receiver(get(Field.Pressure, 0x11))
+
+    assert bus.frames == []
+    assert boiler.stats['lost'] == 1
+
+
+def test_corruption(loop):
+    bus = Recorder()
+    boiler = Boiler(loop, conditions=BusConditions(corruption=1.0), seed=1)
+    boiler.attach(bus)
+
+    bus.receiver(get(Field.Pressure, 0x11))
+
+    with pytest.raises((BufferError, ValueError)):
+        ElcobusFrame.from_bytes(bus.frames[0])
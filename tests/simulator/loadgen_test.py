@@ -0,0 +1,24 @@
+from elcobus.simulator.boiler import Boiler
+from elcobus.simulator.loadgen import LoadGenerator
+from elcobus.simulator.transport import InProcessBroker, MqttBus
+
+
+def test_load(loop, settle):
+    broker = InProcessBroker(loop)
+
+    boiler_client = broker.client()
+    boiler = Boiler(loop, seed=1)
+    boiler.attach(MqttBus(boiler_client, 'elcobus'))
+    boiler_client.connect()
+
+    generator_client = broker.client()
+    generator = LoadGenerator(generator_client, 'elcobus', rate=500, loop=loop)
+    generator_client.connect()
+
+    loop.run_until_complete(generator.run(0.2))
+    settle()
+
+    assert generator.stats['sent'] > 0
+    assert generator.stats['Ret'] == generator.stats['sent']
+    assert generator.stats['invalid'] == 0
+    assert boiler.stats['replied'] == generator.stats['sent']
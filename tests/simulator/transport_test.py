@@ -0,0 +1,62 @@
+import os
+
+from elcobus.simulator.transport import InProcessBroker, PtyBus
+
+
+def test_publish_subscribe(loop, settle):
+    broker = InProcessBroker(loop)
+    received = []
+
+    rx = broker.client()
+    rx.on_message = lambda client, user_data, msg: received.append((msg.topic, msg.payload))
+    rx.connect()
+    rx.subscribe('elcobus/+')
+
+    tx = broker.client()
+    tx.connect()
+    tx.publish('elcobus/Pressure', 1.5)
+    tx.publish('other/Pressure', 1.5)
+    settle()
+
+    assert received == [('elcobus/Pressure', b'1.5')]
+
+
+def test_retained(loop, settle):
+    broker = InProcessBroker(loop)
+    tx = broker.client()
+    tx.connect()
+    tx.publish('elcobus/Status', 3, retain=True)
+
+    received = []
+    rx = broker.client()
+    rx.on_message = lambda client, user_data, msg: received.append((msg.payload, msg.retain))
+    rx.connect()
+    rx.subscribe('elcobus/#')
+    settle()
+
+    assert received == [(b'3', True)]
+
+
+def test_on_connect(loop, settle):
+    broker = InProcessBroker(loop)
+    connected = []
+    client = broker.client()
+    client.on_connect = lambda client, user_data, flags, rc: connected.append(rc)
+    client.connect()
+    settle()
+    assert connected == [0]
+    assert client.is_connected()
+
+
+def test_pty_resync(loop, settle):
+    bus = PtyBus(loop)
+    received = []
+    bus.receiver = received.append
+    try:
+        plain = b'\xdc\x80\x01\x0e\x07\x11\x3d\x30\x63\x00\x00\x0a\x85\x32'
+        unkn1 = b'\xde' + plain[1:]
+        os.write(bus.slave, b'\x00\xff' + plain + b'\x42' + unkn1)
+        settle()
+    finally:
+        bus.close()
+    assert received == [plain, unkn1]